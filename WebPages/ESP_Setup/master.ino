@@ -16,6 +16,15 @@ const uint8_t broadcastAddress[] = {0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF};
 // We will use a special ID to signify a broadcast message
 const uint8_t BROADCAST_ID = 255;
 
+// A packet with this ID is a probe from the host: answer with the ready line
+const uint8_t PROBE_ID = 254;
+const char READY_LINE[] = "GATEWAY_READY";
+
+// The boot drain below waits for this much silence on the line. It is longer
+// than one packet (61 bytes at 115200 baud take ~5.3 ms), so a probe that is
+// still arriving is read to its end instead of leaving misaligned bytes.
+const unsigned long DRAIN_QUIET_MS = 20;
+
 // Callback for when data is sent
 // NOTE: The function signature is updated to match the newer ESP32 libraries.
 void OnDataSent(const wifi_tx_info_t *info, esp_now_send_status_t status) {
@@ -44,6 +53,18 @@ void setup() {
       return;
     }
   }
+
+  // Drop anything the host sent while we were booting (possibly partial
+  // packets) until the line is quiet, so framing starts clean, then tell
+  // the host we are ready.
+  unsigned long quietSince = millis();
+  while (millis() - quietSince < DRAIN_QUIET_MS) {
+    if (Serial.available()) {
+      Serial.read();
+      quietSince = millis();
+    }
+  }
+  Serial.println(READY_LINE);
 }
 
 void loop() {
@@ -57,7 +78,10 @@ void loop() {
     int bytesRead = Serial.readBytes(payloadBuffer, sizeof(payloadBuffer));
 
     if (bytesRead > 0) {
-      if (targetSlaveId == BROADCAST_ID) {
+      if (targetSlaveId == PROBE_ID) {
+        // --- Host is looking for the gateway ---
+        Serial.println(READY_LINE);
+      } else if (targetSlaveId == BROADCAST_ID) {
         // --- Send to All Slaves (Broadcast) ---
         esp_now_send(broadcastAddress, payloadBuffer, bytesRead);
       } else {
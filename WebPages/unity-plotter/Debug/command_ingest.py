@@ -0,0 +1,127 @@
+"""
+Parsing of the bodies accepted by POST /commands.
+
+Bulk formats carry many batches per request, each with its own timestamp
+(seconds since the epoch) and compact commands [addr, mode, duty, freq]:
+
+  application/json      [{"timestamp": t, "commands": [[addr, mode, duty, freq], ...]}, ...]
+                        (commands may also be {"addr", "mode", "duty", "freq"} objects)
+  application/x-ndjson  one {"timestamp": t, "commands": [...]} batch per line
+  application/octet-stream
+                        BINARY_MAGIC + version byte, then per batch a BATCH_HEADER
+                        (float64 timestamp, uint16 count) and count BINARY_COMMAND
+                        records (addr, mode, duty, freq as uint8)
+
+The legacy JSON body {"command": "<concatenated JSON objects>", "timestamp": t}
+is still accepted. Every parser validates the whole body in one pass and
+returns the command dicts stored by the server, or raises ValueError.
+"""
+import json
+import re
+import struct
+
+BINARY_MAGIC = b'HCMD'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<4sB')
+BATCH_HEADER = struct.Struct('<dH')
+BINARY_COMMAND = struct.Struct('<4B')
+
+FIELDS = ('addr', 'mode', 'duty', 'freq')
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_batch(batch, default_timestamp=None):
+    """{"timestamp": t, "commands": [...]} -> list of command dicts."""
+    if not isinstance(batch, dict) or not isinstance(batch.get('commands'), list):
+        raise ValueError("a batch must be an object with a 'commands' list")
+    timestamp = batch.get('timestamp', default_timestamp)
+    if not isinstance(timestamp, (int, float)) or isinstance(timestamp, bool):
+        raise ValueError(f"invalid batch timestamp {timestamp!r}")
+
+    commands = []
+    for command in batch['commands']:
+        if isinstance(command, dict):
+            values = tuple(command.get(field) for field in FIELDS)
+        elif isinstance(command, list) and len(command) == len(FIELDS):
+            values = tuple(command)
+        else:
+            raise ValueError(f"invalid command {command!r}")
+        if not all(_is_int(value) for value in values):
+            raise ValueError(f"invalid command {command!r}: addr, mode, duty and freq must be integers")
+        commands.append({'addr': values[0], 'mode': values[1], 'duty': values[2], 'freq': values[3],
+                         'timestamp': timestamp})
+    return commands
+
+
+def parse_json(data, default_timestamp):
+    """A JSON array of batches, or the legacy {"command", "timestamp"} object."""
+    if isinstance(data, list):
+        return [command for batch in data for command in parse_batch(batch, default_timestamp)]
+    if isinstance(data, dict) and 'command' in data:
+        return parse_legacy(data, default_timestamp)
+    if isinstance(data, dict):
+        return parse_batch(data, default_timestamp)
+    raise ValueError("expected a JSON array of batches")
+
+
+def parse_legacy(data, default_timestamp):
+    """The original format: JSON objects concatenated in a string."""
+    timestamp = data.get('timestamp') or default_timestamp
+    commands = []
+    for segment in re.findall(r'\{.*?\}', data['command'] or ''):
+        parsed = json.loads(segment)
+        commands.append({'addr': parsed['addr'], 'mode': parsed['mode'], 'duty': parsed['duty'],
+                         'freq': parsed['freq'], 'timestamp': timestamp})
+    return commands
+
+
+def parse_ndjson(body, default_timestamp):
+    commands = []
+    for line in body.splitlines():
+        if line.strip():
+            commands.extend(parse_batch(json.loads(line), default_timestamp))
+    return commands
+
+
+def parse_binary(body):
+    if len(body) < BINARY_HEADER.size:
+        raise ValueError("binary body too short")
+    magic, version = BINARY_HEADER.unpack_from(body)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError(f"not a version {BINARY_VERSION} binary command body")
+
+    commands = []
+    offset = BINARY_HEADER.size
+    while offset < len(body):
+        if offset + BATCH_HEADER.size > len(body):
+            raise ValueError("truncated batch header")
+        timestamp, count = BATCH_HEADER.unpack_from(body, offset)
+        offset += BATCH_HEADER.size
+        end = offset + count * BINARY_COMMAND.size
+        if end > len(body):
+            raise ValueError("truncated batch")
+        for addr, mode, duty, freq in BINARY_COMMAND.iter_unpack(body[offset:end]):
+            commands.append({'addr': addr, 'mode': mode, 'duty': duty, 'freq': freq, 'timestamp': timestamp})
+        offset = end
+    return commands
+
+
+def encode_binary(batches):
+    """[(timestamp, [(addr, mode, duty, freq), ...]), ...] -> binary body (for clients and tests)."""
+    parts = [BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION)]
+    for timestamp, commands in batches:
+        parts.append(BATCH_HEADER.pack(timestamp, len(commands)))
+        parts.extend(BINARY_COMMAND.pack(*command) for command in commands)
+    return b''.join(parts)
+
+
+def parse_body(mimetype, body, default_timestamp):
+    """Dispatches on the Content-Type of the request."""
+    if mimetype == 'application/octet-stream':
+        return parse_binary(body)
+    if mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return parse_ndjson(body.decode('utf-8'), default_timestamp)
+    return parse_json(json.loads(body), default_timestamp)
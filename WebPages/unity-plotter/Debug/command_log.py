@@ -0,0 +1,73 @@
+"""
+Time-ordered log of the commands received by the debug server.
+
+Commands are kept sorted by timestamp with their timestamps in a parallel
+list, so a time window is found by bisection instead of scanning the whole
+session. Entries older than `retention` seconds are evicted as new ones arrive
+(and before each query); an optional archive sink receives them, e.g. to keep
+the full session on disk while memory stays bounded.
+"""
+import bisect
+import json
+import threading
+import time
+
+
+class CommandLog:
+    def __init__(self, retention=300.0, archive=None):
+        """archive: optional function called with the list of evicted commands."""
+        self.retention = retention
+        self.archive = archive
+        self.lock = threading.Lock()
+        # Evicted entries are skipped with _start and compacted in bulk
+        self._timestamps = []
+        self._commands = []
+        self._start = 0
+
+    def extend(self, commands):
+        """Adds command dicts carrying a 'timestamp' (seconds since the epoch)."""
+        with self.lock:
+            for command in commands:
+                timestamp = command['timestamp']
+                if not self._timestamps or timestamp >= self._timestamps[-1]:
+                    self._timestamps.append(timestamp)
+                    self._commands.append(command)
+                else:
+                    # Late batch: keep the log sorted
+                    index = bisect.bisect_right(self._timestamps, timestamp, self._start)
+                    self._timestamps.insert(index, timestamp)
+                    self._commands.insert(index, command)
+            self._evict(time.time())
+
+    def _evict(self, now):
+        end = bisect.bisect_left(self._timestamps, now - self.retention, self._start)
+        if end == self._start:
+            return
+        if self.archive is not None:
+            self.archive(self._commands[self._start:end])
+        self._start = end
+        if self._start > len(self._timestamps) // 2:
+            del self._timestamps[:self._start]
+            del self._commands[:self._start]
+            self._start = 0
+
+    def window(self, since=None, until=None):
+        """Commands with since <= timestamp <= until, oldest first."""
+        with self.lock:
+            self._evict(time.time())
+            first = self._start if since is None else bisect.bisect_left(self._timestamps, since, self._start)
+            last = len(self._timestamps) if until is None else bisect.bisect_right(self._timestamps, until, first)
+            return self._commands[first:last]
+
+    def __len__(self):
+        return len(self._timestamps) - self._start
+
+
+class JsonLinesArchive:
+    """Archive sink appending evicted commands to a file, one JSON object per line."""
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, commands):
+        with open(self.path, 'a') as f:
+            f.writelines(json.dumps(command) + '\n' for command in commands)
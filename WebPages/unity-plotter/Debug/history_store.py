@@ -0,0 +1,88 @@
+"""
+Bounded, columnar store for the full-history values of the debug server.
+
+Each key gets a fixed-capacity ring buffer that add_data() appends to, so the
+last N values of every key are read without scanning the session and memory
+does not grow with its length. Numbers and tuples of numbers are kept in NumPy
+arrays; a buffer falls back to Python objects when a key receives other values.
+"""
+import numbers
+
+import numpy as np
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+
+class RingBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = None
+        self.count = 0   # values appended so far
+
+    def _allocate(self, value):
+        if _is_number(value):
+            return np.zeros(self.capacity, dtype=np.int64 if isinstance(value, numbers.Integral) else np.float64)
+        if isinstance(value, tuple) and value and all(_is_number(v) for v in value):
+            return np.zeros((self.capacity, len(value)), dtype=np.float64)
+        return np.empty(self.capacity, dtype=object)
+
+    def _fits(self, value):
+        if self.data.dtype == object:
+            return True
+        if self.data.ndim == 2:
+            return (isinstance(value, tuple) and len(value) == self.data.shape[1]
+                    and all(_is_number(v) for v in value))
+        if self.data.dtype == np.int64:
+            return isinstance(value, numbers.Integral) and not isinstance(value, bool)
+        return _is_number(value)
+
+    def _widen(self):
+        # Python objects keep every value as it came, e.g. ints stay ints next to floats
+        data = np.empty(self.capacity, dtype=object)
+        for i, stored in enumerate(self.data.tolist()):
+            data[i] = tuple(stored) if self.data.ndim == 2 else stored
+        self.data = data
+
+    def append(self, value):
+        if self.data is None:
+            self.data = self._allocate(value)
+        elif not self._fits(value):
+            self._widen()
+        self.data[self.count % self.capacity] = value
+        self.count += 1
+
+    def last(self, n):
+        """The last n values, oldest first, as a list."""
+        n = min(n, self.count, self.capacity)
+        if n == 0:
+            return []
+        end = self.count % self.capacity
+        values = self.data[np.arange(end - n, end) % self.capacity]
+        if values.ndim == 2:
+            return [tuple(row) for row in values.tolist()]
+        return values.tolist()
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+
+class HistoryStore:
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.columns = {}   # key -> RingBuffer, in order of first appearance
+
+    def append(self, row):
+        for key, value in row.items():
+            column = self.columns.get(key)
+            if column is None:
+                column = self.columns[key] = RingBuffer(self.capacity)
+            column.append(value)
+
+    def last(self, n):
+        """{key: last n values of that key}."""
+        return {key: column.last(n) for key, column in self.columns.items()}
+
+    def clear(self):
+        self.columns = {}
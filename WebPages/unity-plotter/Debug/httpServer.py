@@ -1,39 +1,66 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-import pandas as pd
 from datetime import datetime, timedelta
-import re
-import json
 import time
 
+from history_store import HistoryStore
+from command_log import CommandLog, JsonLinesArchive
+from command_ingest import parse_body
+from session_export import SessionExporter
+from live_updates import UpdateHub
+
 
 app = Flask(__name__)
 CORS(app)
 
+# Values per full-history item returned by /data, and kept in memory for it
+HISTORY_LENGTH = 100
+HISTORY_CAPACITY = 1000
+
+# Each session's full-history rows are streamed to session-<start time>.csv (and .parquet) here
+EXPORT_DIR = 'sessions'
+
+# Commands are kept this many seconds; older ones go to COMMAND_ARCHIVE (NDJSON) if set
+COMMAND_RETENTION = 300
+COMMAND_ARCHIVE = None
+# Window returned by /getCommands when no since= is given
+RECENT_COMMANDS = 5
+
+# Pushes new history values, last values and commands to /subscribe clients
+updates = UpdateHub(HISTORY_LENGTH)
+
 class DataManager:
     def __init__(self):
-        self.full_history_data = []
+        self.exporter = None  # streams the rows of the running session to disk
+        self.history = HistoryStore(HISTORY_CAPACITY)  # recent rows per key, for /data
         self.last_values = {}
         self.started = False
         # Define the data items for which you want to store the full history
         self.full_history_items = {'camera', 'temperature', 'humidity'}
-        self.commands = []  # Initialize the commands array
+        archive = JsonLinesArchive(COMMAND_ARCHIVE) if COMMAND_ARCHIVE else None
+        self.commands = CommandLog(COMMAND_RETENTION, archive)  # time-ordered, old entries evicted
 
     def start(self):
+        if self.exporter is not None:
+            self.exporter.close()
         self.started = True
-        self.full_history_data = []
+        self.exporter = SessionExporter(EXPORT_DIR)
+        self.history.clear()
         self.last_values = {}
 
     def quit(self):
         self.started = False
-        df = pd.DataFrame(self.full_history_data)
-        df.to_csv('data.csv', index=False)
+        # Rows are already on disk: only the last chunk is left to write
+        if self.exporter is not None:
+            print(f"Session saved to {self.exporter.close()}")
+            self.exporter = None
 
     def add_data(self, data):
         if self.started:
             row_data = handle_json(data)
             timestamp = row_data.get('timestamp')
             full_history_row = {'timestamp': timestamp}
+            changed_values = {}
             # Process each data item
             for key, value in row_data.items():
                 if key == 'timestamp':
@@ -46,40 +73,34 @@ class DataManager:
                     full_history_row[key[3:]] = value
                 else:
                     # Store only the last value
+                    if key not in self.last_values or self.last_values[key] != value:
+                        changed_values[key] = value
                     self.last_values[key] = value
             if len(full_history_row) > 1:
-                self.full_history_data.append(full_history_row)
+                exporter = self.exporter  # quit() may close it from another request thread: append() then drops the row
+                if exporter is not None:
+                    exporter.append(full_history_row)
+                self.history.append(full_history_row)
+            updates.publish(full_history_row if len(full_history_row) > 1 else None, changed_values)
             return True
         else:
             return False
 
-    def get_data(self):
-        # Restructure full_history_data to group values by keys
-        full_history_dict = {}
-        for entry in self.full_history_data:
-            for key, value in entry.items():
-                if key not in full_history_dict:
-                    full_history_dict[key] = []
-                full_history_dict[key].append(value)
+    def get_data(self, number_of_values=HISTORY_LENGTH):
+        # The history store already groups values by key
         return {
-            'full_history': get_last_values(full_history_dict),
+            'full_history': self.history.last(number_of_values),
             'last_values': self.last_values  # Ensure last_values is returned as is
         }
 
-    def get_commands(self):
-        #return the commands that have been received the last 5 seconds
-        current_time = time.time()
-        commands = [command for command in self.commands if current_time - command['timestamp'] <= 5]
-        return commands
+    def get_commands(self, since=None, until=None):
+        # By default, return the commands that have been received the last 5 seconds
+        if since is None:
+            since = time.time() - RECENT_COMMANDS
+        return self.commands.window(since, until)
 
         
 
-def get_last_values(history, number_of_values=100):
-    last_values = {}
-    for key, values in history.items():
-        last_values[key] = values[-number_of_values:]
-    return last_values
-
 data_manager = DataManager()
 
 def handle_json(json_data):
@@ -119,35 +140,32 @@ def endpoint():
 
 @app.route('/commands', methods=['POST'])
 def receive_command():
-    data = request.get_json()
-    command = data.get('command')
-    time = data.get('timestamp')
-    try:        
-        data_segments = re.findall(r'\{.*?\}', command)
-        if not data_segments:
-            return  
-
-        commands = []
-        for data_segment in data_segments:
-            data_parsed = json.loads(data_segment)
-            command = {
-                'addr': data_parsed['addr'], 
-                'mode': data_parsed['mode'], 
-                'duty': data_parsed['duty'], 
-                'freq': data_parsed['freq'],
-                'timestamp': time
-            }
-            commands.append(command)
-        data_manager.commands.extend(commands)
-        return jsonify({'success': True}), 200
-    except Exception as e:
+    # JSON array, NDJSON or binary bulk body, or the legacy {"command", "timestamp"} (see command_ingest.py)
+    try:
+        commands = parse_body(request.mimetype, request.get_data(), time.time())
+    except (ValueError, KeyError, TypeError) as e:
         return jsonify({'success': False, 'error': str(e)}), 400
-    
+    data_manager.commands.extend(commands)
+    updates.publish(commands=commands)
+    return jsonify({'success': True, 'accepted': len(commands)}), 200
 
 
 @app.route('/getCommands', methods=['GET'])
 def get_commands():
-    return jsonify({'commands': data_manager.get_commands()})
+    # Optional window bounds, in seconds since the epoch like the command timestamps
+    since = request.args.get('since', type=float)
+    until = request.args.get('until', type=float)
+    return jsonify({'commands': data_manager.get_commands(since, until)})
+
+@app.route('/subscribe', methods=['GET'])
+def subscribe():
+    # Server-Sent Events: a snapshot like /data + /getCommands, then only what changed.
+    # ?interval=<ms> sets the minimum time between two events (default 50 ms).
+    interval = request.args.get('interval', 50, type=float) / 1000
+    def snapshot():
+        return {**data_manager.get_data(), 'commands': data_manager.get_commands()}
+    return Response(updates.stream(snapshot, interval), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/data', methods=['GET'])
 def get_data():
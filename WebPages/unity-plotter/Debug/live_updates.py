@@ -0,0 +1,105 @@
+"""
+Push updates for dashboards, instead of polling /data and /getCommands.
+
+The DataManager publishes what changes: new full-history values, changed
+last values and new commands. Every subscriber has its own pending delta that
+new changes are merged into (history values appended per key and capped to
+the last `max_values`, last values latest-wins, commands capped to
+`max_commands`). A slow subscriber therefore receives one merged delta when
+it is ready again, not a backlog of events, and the server never serializes
+more than what changed since the subscriber's previous event.
+"""
+import json
+import threading
+import time
+
+
+class Subscriber:
+    def __init__(self, max_values, max_commands):
+        self.max_values = max_values
+        self.max_commands = max_commands
+        self.changed = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self.history = {}
+        self.last_values = {}
+        self.commands = []
+        self.commands_dropped = 0
+
+    def merge(self, history, last_values, commands):
+        with self.changed:
+            for key, value in history.items():
+                values = self.history.setdefault(key, [])
+                values.append(value)
+                if len(values) > self.max_values:
+                    del values[:len(values) - self.max_values]
+            self.last_values.update(last_values)
+            if commands:
+                self.commands.extend(commands)
+                overflow = len(self.commands) - self.max_commands
+                if overflow > 0:
+                    del self.commands[:overflow]
+                    self.commands_dropped += overflow
+            self.changed.notify()
+
+    def take(self, timeout):
+        """Waits up to timeout for changes; returns the merged delta or None."""
+        with self.changed:
+            if not (self.history or self.last_values or self.commands):
+                self.changed.wait(timeout)
+            if not (self.history or self.last_values or self.commands):
+                return None
+            delta = {'full_history': self.history, 'last_values': self.last_values, 'commands': self.commands}
+            if self.commands_dropped:
+                delta['commands_dropped'] = self.commands_dropped
+            self._reset()
+            return delta
+
+
+class UpdateHub:
+    def __init__(self, max_values=100, max_commands=1000):
+        self.max_values = max_values
+        self.max_commands = max_commands
+        self.lock = threading.Lock()
+        self.subscribers = set()
+
+    def publish(self, history=None, last_values=None, commands=None):
+        """history: {key: new value}; last_values: {key: value}; commands: list of command dicts."""
+        if not (history or last_values or commands):
+            return
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.merge(history or {}, last_values or {}, commands or [])
+
+    def stream(self, snapshot, min_interval=0.05, keepalive=15.0):
+        """
+        Server-Sent Events generator for one subscriber: a 'snapshot' event with
+        the result of snapshot(), then 'delta' events at most every
+        min_interval seconds. The snapshot is taken after subscribing, so no
+        change falls between the two.
+        """
+        subscriber = Subscriber(self.max_values, self.max_commands)
+        with self.lock:
+            self.subscribers.add(subscriber)
+        try:
+            yield f"event: snapshot\ndata: {json.dumps(snapshot())}\n\n"
+            sent_at = 0.0
+            while True:
+                # Changes arriving meanwhile are merged into the next event
+                wait = sent_at + min_interval - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                delta = subscriber.take(keepalive)
+                if delta is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: delta\ndata: {json.dumps(delta)}\n\n"
+                sent_at = time.monotonic()
+        finally:
+            with self.lock:
+                self.subscribers.discard(subscriber)
+
+    def __len__(self):
+        return len(self.subscribers)
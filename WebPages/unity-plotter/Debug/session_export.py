@@ -0,0 +1,154 @@
+"""
+Streaming export of the full-history rows of a debug-server session.
+
+Rows are buffered and appended to disk in chunks while the session runs, so
+ending a session only writes the last chunk and no session is ever held in
+memory. Every session gets its own files in `directory`:
+
+    session-<start time>.csv        always
+    session-<start time>.parquet    when pyarrow is installed
+
+Files are created exclusively, never overwritten: a session started within
+the same second as an earlier one is named session-<start time>_2, _3, ...
+Files are fsynced at most every `fsync_interval` seconds. The columns are
+those seen in the first chunk; if later rows bring new keys, the export
+continues in a new part with the extended header (session-<start time>-001.csv).
+"""
+import csv
+import os
+import threading
+import time
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+def _arrow_value(value):
+    return list(value) if isinstance(value, tuple) else value
+
+class SessionExporter:
+    def __init__(self, directory='sessions', session=None, chunk_rows=500, flush_interval=1.0,
+                 fsync_interval=5.0, parquet=True):
+        self.directory = directory
+        self.session = session or time.strftime('%Y%m%d-%H%M%S')
+        self.chunk_rows = chunk_rows
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.parquet = parquet and pq is not None
+        self.lock = threading.Lock()
+
+        self.rows = []
+        self.columns = None
+        self.part = -1
+        self.csv_file = None
+        self.csv_writer = None
+        self.parquet_writer = None
+        self.flushed_at = time.monotonic()
+        self.synced_at = time.monotonic()
+        self.rows_written = 0
+        self.paths = []
+        self.closed = False
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, extension):
+        suffix = f'-{self.part:03d}' if self.part else ''
+        return os.path.join(self.directory, f'session-{self.session}{suffix}.{extension}')
+
+    def append(self, row):
+        """Buffers one row; returns False without writing it once the exporter is closed."""
+        with self.lock:
+            if self.closed:
+                return False
+            self.rows.append(row)
+            if len(self.rows) >= self.chunk_rows or time.monotonic() - self.flushed_at >= self.flush_interval:
+                self._write_chunk()
+            return True
+
+    def close(self):
+        """Writes the last chunk and closes the files. Returns the paths written."""
+        with self.lock:
+            if self.closed:
+                return self.paths
+            self.closed = True
+            self._write_chunk()
+            self._close_part(sync=True)
+            return self.paths
+
+    def _write_chunk(self):
+        self.flushed_at = time.monotonic()
+        if not self.rows:
+            return
+        rows, self.rows = self.rows, []
+
+        columns = list(self.columns or [])
+        known = set(columns)
+        for row in rows:
+            for key in row:
+                if key not in known:
+                    known.add(key)
+                    columns.append(key)
+        if columns != self.columns:
+            self._close_part(sync=True)
+            self._open_part(columns)
+
+        self.csv_writer.writerows(rows)
+        self.csv_file.flush()
+        if self.parquet:
+            self._write_parquet(rows)
+        self.rows_written += len(rows)
+
+        if time.monotonic() - self.synced_at >= self.fsync_interval:
+            os.fsync(self.csv_file.fileno())
+            self.synced_at = time.monotonic()
+
+    def _open_part(self, columns):
+        self.columns = columns
+        self.part += 1
+        base, duplicate = self.session, 1
+        while True:
+            path = self._path('csv')
+            try:
+                self.csv_file = open(path, 'x', newline='')
+                break
+            except FileExistsError:
+                if self.part:
+                    raise
+                duplicate += 1
+                self.session = f'{base}_{duplicate}'
+        self.csv_writer = csv.DictWriter(self.csv_file, fieldnames=columns, restval='')
+        self.csv_writer.writeheader()
+        self.paths.append(path)
+
+    def _close_part(self, sync=False):
+        if self.csv_file is not None:
+            self.csv_file.flush()
+            if sync:
+                os.fsync(self.csv_file.fileno())
+            self.csv_file.close()
+            self.csv_file = None
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+            self.parquet_writer = None
+
+    def _write_parquet(self, rows):
+        # Tuples become list<double> columns; values pyarrow cannot type stop the Parquet export
+        try:
+            table = pa.Table.from_pylist([
+                {column: _arrow_value(row.get(column)) for column in self.columns} for row in rows
+            ])
+            if self.parquet_writer is None:
+                path = self._path('parquet')
+                self.parquet_writer = pq.ParquetWriter(path, table.schema)
+                self.paths.append(path)
+            else:
+                table = table.cast(self.parquet_writer.schema)
+            self.parquet_writer.write_table(table)
+        except (pa.ArrowException, ValueError) as e:
+            print(f"Parquet export stopped ({e}), the CSV export goes on")
+            if self.parquet_writer is not None:
+                self.parquet_writer.close()
+            self.parquet_writer = None
+            self.parquet = False
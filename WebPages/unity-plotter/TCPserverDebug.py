@@ -1,181 +1,361 @@
+import argparse
 import asyncio
-import json
-import re
+import os
+import queue
 import time
 import sys
+from urllib.parse import parse_qs, urlsplit
 
 import websockets
-import aiohttp
-# Use the new API that supports multiple slaves
-from serial_api_flexible import SERIAL_API
-
-# This will hold an instance of your API class
-haptic_api = None
-
-# Unified Batching System
-message_batch = {}
-batch_first_time = None
-batch_lock = asyncio.Lock()
-IMMEDIATE_THRESHOLD = 20
+from aiohttp import web
+from haptic_protocol import (SUBPROTOCOL_BINARY_V1, ProtocolError, decode_frame,
+                             decode_json_message, select_subprotocol)
+from topology import Topology
+from batch_pipeline import BatchPipeline, FrameTicker
+from client_scheduler import ClientScheduler, parse_client_policy
+from motor_state import MotorStateMirror
+from gateway_link import GatewayLink
+from telemetry import TelemetryShipper
+from command_journal import CommandJournal
+from latency_metrics import LatencyTracker
+
+# One GatewayLink (SERIAL_API + writer + LinkGovernor) per gateway, created in main()
+gateways = []
+
+# addr -> slave routing, loaded in main()
+TOPOLOGY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'topology.json')
+topology = Topology()
+
+# Unified Batching System, shared by all connections (created in main()):
+# a BatchPipeline, or a FrameTicker when TICK_RATE is set
+pipeline = None
 DEBUG = False
 
-def send_commands_via_serial(api_instance, combined_message):
+# Merges the connected clients into the pipeline (created in main())
+scheduler = None
+CLIENT_POLICIES = {}         # client name -> ClientPolicy(priority, rate), see --client
+CLIENT_RATE = 0              # commands/s allowed to clients without a policy, 0 = unlimited
+CLAIM_HOLD_TIME = 0.5        # seconds a client keeps priority on the addresses it drove
+
+# Latency budgets (configurable from the command line)
+BATCH_THRESHOLD = 10         # flush as soon as this many addresses are pending
+BATCH_LATENCY_BUDGET = 0.2   # max seconds the first command of a batch may wait
+MAX_IN_FLIGHT_FLUSHES = 2
+TICK_RATE = 0                # Hz; > 0 switches to fixed-rate full-frame transmission
+SERIAL_QUEUE_SIZE = 64       # packets waiting for the serial writer thread
+BAUDRATE = 115200            # gateway link speed, also used to pace the writes
+GATEWAY_PORT = None          # serial port of the gateway; found automatically when None.
+                             # With several gateways, the ports come from the topology file.
+RESEND_AFTER = 1.0           # identical commands are dropped unless their state is older than this
+
+# Last state sent to every motor, used to drop redundant commands
+motor_mirror = MotorStateMirror(RESEND_AFTER)
+
+# Ships the dispatched commands to the logging server (created in main())
+LOG_URL = 'http://localhost:5000/commands'
+LOG_INTERVAL = 0.25          # seconds between two shipments to the logging server
+telemetry = None
+
+# Optional binary journal of every dispatched command (--journal DIR)
+JOURNAL_DIR = None
+journal = None
+
+# Per-stage latency histograms, served as JSON on http://localhost:METRICS_PORT/metrics
+latency = LatencyTracker()
+METRICS_PORT = 9053          # 0 disables the endpoint
+METRICS_DUMP = None          # JSON file the latency report is written to at shutdown
+
+def submit_to_gateways(per_slave, force=False):
+    """
+    Queues {slave_id: commands} on the link governor of the gateway of each
+    slave. Slaves behind a gateway that is not connected are skipped; the
+    other gateways are not affected.
+    """
+    for index, gateway_slaves in topology.split_gateways(per_slave).items():
+        gateway = gateways[index]
+        if not gateway.connected:
+            print(f"{gateway.name} not available. Cannot send commands to slaves {sorted(gateway_slaves)}.")
+            continue
+        gateway.governor.submit(gateway_slaves, force=force)
+
+async def send_commands_via_serial(commands, suppress_redundant=True):
     """
-    Parses JSON messages, determines the target slave from the first command,
-    and sends the entire list to the haptic API.
+    Splits the (slave_id, addr, duty, freq, mode) records into per-slave
+    sub-batches using the topology and queues them on the link governor of
+    their gateway, which sends them as fast as that link allows. Commands that
+    would not change the motor state are dropped there, unless
+    suppress_redundant is False.
     """
-    if not api_instance or not api_instance.connected:
+    if not gateways:
         print("Haptic API not available. Cannot send commands.")
         return
 
-    try:
-        data_segments = re.findall(r'\{.*?\}', combined_message)
-        if not data_segments:
-            return
-
-        # --- NEW LOGIC: Determine the target slave ---
-        # Look at the first command in the batch to decide the destination.
-        first_command_data = json.loads(data_segments[0])
-        # Default to slave 0 if no 'slave_id' is specified in the JSON from Unity.
-        target_slave_id = first_command_data.get('slave_id', 0)
-
-        commands_list = []
-        for segment in data_segments:
-            data = json.loads(segment)
-            command_dict = {
-                'addr': data.get('addr'),
-                'duty': data.get('duty'),
-                'freq': data.get('freq'),
-                'start_or_stop': data.get('mode') # Map old 'mode' key to new 'start_or_stop'
-            }
-            commands_list.append(command_dict)
-
-        if commands_list:
-            # --- MODIFIED API CALL ---
-            # Pass the target_slave_id to the API's send_command_list method.
-            api_instance.send_command_list(target_slave_id, commands_list)
+    per_slave = topology.split(commands)
+    latency.flushed(per_slave)
+    submit_to_gateways(per_slave, force=not suppress_redundant)
 
-    except Exception as e:
-        print(f"❌ Error in send_commands_via_serial: {e}")
+async def send_to_slaves(gateway, per_slave):
+    """
+    Hands each slave's (addr, duty, freq, mode) commands to the serial writer
+    thread, then waits for the writes without blocking the event loop.
+    Commands written successfully become the mirrored motor state and are
+    journaled when a journal is enabled.
+    """
+    writes = {}
+    for slave_id, slave_commands in per_slave.items():
+        stamps = latency.released(slave_id, slave_commands)
+        try:
+            write = gateway.api.send_commands_async(gateway.local_id(slave_id), slave_commands)
+            writes[slave_id] = (write, stamps, time.monotonic())
+        except queue.Full:
+            print(f"⚠️  Serial queue full, dropping {len(slave_commands)} commands for slave #{slave_id}")
+        except Exception as e:
+            print(f"❌ Error in send_commands_via_serial (slave #{slave_id}): {e}")
+
+    for slave_id, (write, stamps, encoded) in writes.items():
+        if await write:
+            latency.written(slave_id, stamps, encoded)
+            motor_mirror.acknowledge(slave_id, per_slave[slave_id])
+            if journal is not None:
+                journal.write(slave_id, per_slave[slave_id])
+        else:
+            print(f"❌ Could not send {len(per_slave[slave_id])} commands to slave #{slave_id}")
+
+async def resync_all():
+    """
+    Re-sends the last known state of every motor, e.g. after a slave rebooted.
+    Triggered by a {"control": "resync"} message.
+    """
+    per_slave = motor_mirror.resync_all()
+    print(f"Resyncing {sum(len(c) for c in per_slave.values())} motors on {len(per_slave)} slaves...")
+    if gateways:
+        submit_to_gateways(per_slave, force=True)
 
 async def handle_connection(websocket):
     """
-    Starts the background tasks for processing the unified message batch.
+    Feeds the messages of one connection into its client queue of the
+    scheduler. The client is named by the ?client= query parameter of the
+    connection URL. Nothing is left running once the connection closes.
     """
-    print('✅ WebSocket connection established!')
-    asyncio.create_task(collect_messages(websocket))
-    asyncio.create_task(process_batch_timer())
-    await websocket.wait_closed()
+    name = parse_qs(urlsplit(websocket.request.path).query).get('client', [None])[0]
+    client = scheduler.connect(name)
+    print(f'✅ WebSocket connection established! (client: {client.name}, priority: {client.priority}, '
+          f'protocol: {websocket.subprotocol or "json"})')
+    try:
+        await collect_messages(websocket, client)
+    finally:
+        scheduler.disconnect(client)
 
-async def collect_messages(websocket):
+async def collect_messages(websocket, client):
     """
-    Collects all incoming messages from the WebSocket into a single, unified batch.
+    Collects all incoming messages from the WebSocket into the client's queue.
+    Text messages are legacy JSON commands; binary messages are whole haptic
+    frames and are only accepted if the connection negotiated the binary protocol.
     """
-    global message_batch, batch_first_time
+    binary_enabled = websocket.subprotocol == SUBPROTOCOL_BINARY_V1
     try:
         async for message in websocket:
-            try:
-                msg_obj = json.loads(message)
-            except Exception as e:
-                print(f"Error parsing JSON: {e}")
-                continue
-
-            addr = msg_obj.get('addr')
-            if addr is None:
-                continue
-
-            async with batch_lock:
-                if not message_batch:
-                    batch_first_time = time.time()
-                message_batch[addr] = message
-
-                if len(message_batch) >= IMMEDIATE_THRESHOLD:
-                    combined_message = ''.join(message_batch.values())
-                    message_batch.clear()
-                    batch_first_time = None
-                    asyncio.create_task(process_batch_immediate_flush(combined_message))
+            received = time.monotonic()
+            if isinstance(message, bytes):
+                if not binary_enabled:
+                    print("Binary frame received without negotiating the binary protocol, ignoring.")
+                    continue
+                try:
+                    records, rejected = decode_frame(message)
+                except ProtocolError as e:
+                    print(f"Error decoding binary frame: {e}")
+                    continue
+                if rejected:
+                    print(f"Ignoring {len(rejected)} invalid records of a binary frame (first: {rejected[0]})")
+            else:
+                try:
+                    record, control = decode_json_message(message)
+                except ValueError as e:
+                    print(f"Error parsing JSON: {e}")
+                    continue
+                if control == 'resync':
+                    await resync_all()
+                    continue
+                if record is None:
+                    continue
+                records = (record,)
+
+            routable = [record for record in records if topology.routable(record[1])]
+            if len(routable) != len(records):
+                print(f"Ignoring {len(records) - len(routable)} commands for addresses without a route")
+                records = routable
+            latency.received([topology.route(record[0], record[1]) for record in records], received)
+            scheduler.submit(client, records)
 
     except websockets.exceptions.ConnectionClosed as e:
         print(f'WebSocket closed: {e}')
     except Exception as e:
         print(f'Error in collect_messages: {e}')
 
-async def process_batch_immediate_flush(combined_message):
+async def flush_batch(commands):
     """
-    Immediately processes and sends the unified message batch.
+    Sends one batch to the gateway and logs it. Run by the pipeline's
+    flush workers.
     """
-    print(f"Flushing immediate batch ({IMMEDIATE_THRESHOLD} messages)...")
-    send_commands_via_serial(haptic_api, combined_message)
-    asyncio.create_task(send_to_server(combined_message))
+    print(f"Flushing batch ({len(commands)} messages)...")
+    await send_commands_via_serial(commands)
+    telemetry.submit(commands)
 
-async def process_batch_timer():
+async def flush_frame(commands):
     """
-    Periodically checks the unified message batch and flushes it if the
-    size or time threshold is met.
+    Sends the full state of the slaves that changed since the last tick.
+    Run by the FrameTicker in fixed-rate mode.
     """
-    global message_batch, batch_first_time
-    THRESHOLD = 10
-    TIMEOUT = 0.2
-
-    while True:
-        await asyncio.sleep(0.05)
-        combined_message = None
-
-        async with batch_lock:
-            if message_batch:
-                now = time.time()
-                if len(message_batch) >= THRESHOLD or (now - batch_first_time >= TIMEOUT):
-                    combined_message = ''.join(message_batch.values())
-                    message_batch.clear()
-                    batch_first_time = None
+    await send_commands_via_serial(commands, suppress_redundant=False)
+    telemetry.submit(commands)
 
-        if combined_message:
-            try:
-                first_msg_len = len(next(iter(message_batch.values())))
-                msg_count = len(combined_message) // first_msg_len
-                print(f"Flushing timed batch ({msg_count} messages)...")
-            except StopIteration:
-                 print("Flushing timed batch...")
+async def metrics(request):
+    """GET /metrics: latency histograms and pipeline counters as JSON."""
+    return web.json_response({
+        'latency': latency.report(),
+        'pipeline': pipeline.stats() if pipeline else None,
+        'clients': scheduler.stats() if scheduler else None,
+        'cpu_s': round(time.process_time(), 3),
+        'gateways': [gateway.stats() for gateway in gateways],
+        'motor_mirror': motor_mirror.stats(),
+        'telemetry': telemetry.stats() if telemetry else None,
+    })
 
-            send_commands_via_serial(haptic_api, combined_message)
-            asyncio.create_task(send_to_server(combined_message))
-
-async def send_to_server(message):
-    """
-    POST the command message to a local server for logging/debugging.
-    """
-    try:
-        async with aiohttp.ClientSession() as session:
-            await session.post('http://localhost:5000/commands', json={'command': message, 'timestamp': time.time()})
-    except Exception as e:
-        print(f"⚠️  Could not connect to logging server: {e}")
+async def start_metrics_server(port):
+    app = web.Application()
+    app.router.add_get('/metrics', metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, 'localhost', port).start()
+    print(f"📈 Metrics available on http://localhost:{port}/metrics")
+    return runner
 
 async def main():
     """
     Initializes the haptic API, connects to the gateway, and starts the server.
     """
-    global haptic_api
+    global topology, pipeline, scheduler, telemetry, journal
 
-    haptic_api = SERIAL_API()
-    available_ports = haptic_api.get_serial_devices()
+    topology = Topology.load(TOPOLOGY_PATH)
 
-    if not available_ports:
-        print("❌ FATAL ERROR: No serial devices found. Please ensure the gateway is connected.")
-        sys.exit(1)
+    if topology.gateways:
+        gateways[:] = [GatewayLink(index, gateway['port'], gateway['slaves'])
+                       for index, gateway in enumerate(topology.gateways)]
+    else:
+        gateways[:] = [GatewayLink(0, GATEWAY_PORT)]
 
-    gateway_port_info = available_ports[2]
-    print(f"Found gateway, attempting to connect to: {gateway_port_info}")
+    # Configured ports first, so discovery skips them
+    configured = {gateway.port for gateway in gateways if gateway.port}
+    for gateway in sorted(gateways, key=lambda gateway: gateway.port is None):
+        if not await gateway.connect(BAUDRATE, exclude=configured):
+            print(f"❌ FATAL ERROR: Could not connect to {gateway.name}. Please ensure it is plugged in "
+                  "(or pass its port with --port / in the topology file).")
+            for connected in gateways:
+                if connected.connected:
+                    connected.disconnect()
+            sys.exit(1)
+        configured.add(gateway.port)
+    for gateway in gateways:
+        gateway.start(send_to_slaves, motor_mirror.filter, BAUDRATE, SERIAL_QUEUE_SIZE)
+    telemetry = TelemetryShipper(LOG_URL, LOG_INTERVAL)
+    await telemetry.start()
+    if JOURNAL_DIR:
+        journal = CommandJournal(JOURNAL_DIR)
+        print(f"Journaling dispatched commands to {journal.path}")
 
-    if not haptic_api.connect_serial_device(gateway_port_info):
-        print(f"❌ FATAL ERROR: Could not connect to gateway on {gateway_port_info}.")
-        sys.exit(1)
+    if TICK_RATE > 0:
+        pipeline = FrameTicker(flush_frame, topology, TICK_RATE)
+        print(f"Fixed-rate mode: sending changed slaves at {TICK_RATE} Hz")
+    else:
+        pipeline = BatchPipeline(flush_batch, topology, BATCH_THRESHOLD, BATCH_LATENCY_BUDGET, MAX_IN_FLIGHT_FLUSHES)
+    pipeline.start()
+    scheduler = ClientScheduler(pipeline.submit, topology, CLIENT_POLICIES, CLIENT_RATE, CLAIM_HOLD_TIME)
+    scheduler.start()
+    metrics_runner = await start_metrics_server(METRICS_PORT) if METRICS_PORT else None
 
     # Start the WebSocket server
-    server = await websockets.serve(handle_connection, 'localhost', 9052)
+    server = await websockets.serve(handle_connection, 'localhost', 9052,
+                                    select_subprotocol=select_subprotocol)
     print("✅ WebSocket server running on ws://localhost:9052")
     print("🚀 System is ready. Waiting for connection from Unity...")
 
-    await asyncio.Future()
+    try:
+        await asyncio.Future()
+    finally:
+        server.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await scheduler.stop()
+        await pipeline.stop()
+        for gateway in gateways:
+            await gateway.stop()
+        await telemetry.stop()
+        if journal is not None:
+            journal.close()
+            print(f"Journaled {journal.records_written} commands")
+        for gateway in gateways:
+            print(f"Stats of {gateway.name}: {gateway.stats()}")
+        print(f"Telemetry stats: {telemetry.stats()}")
+        latency.print_report()
+        if METRICS_DUMP:
+            latency.dump(METRICS_DUMP)
+            print(f"Latency report written to {METRICS_DUMP}")
+        print(f"Motor mirror stats: {motor_mirror.stats()}")
+        for gateway in gateways:
+            gateway.disconnect()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Unity -> ESP-NOW gateway haptic bridge")
+    parser.add_argument('--batch-size', type=int, default=BATCH_THRESHOLD,
+                        help="Flush as soon as this many addresses are pending (default: %(default)s)")
+    parser.add_argument('--latency-budget', type=float, default=BATCH_LATENCY_BUDGET * 1000,
+                        help="Max time in ms a command waits in a batch (default: %(default)s)")
+    parser.add_argument('--resend-after', type=float, default=RESEND_AFTER,
+                        help="Seconds after which an unchanged motor state is sent again; "
+                             "0 disables redundant-command suppression (default: %(default)s)")
+    parser.add_argument('--tick-rate', type=float, default=TICK_RATE,
+                        help="Send the full state of changed slaves at this fixed rate in Hz "
+                             "instead of batching (default: off)")
+    parser.add_argument('--baud', type=int, default=BAUDRATE,
+                        help="Gateway serial baud rate, used to pace writes (default: %(default)s)")
+    parser.add_argument('--port', default=GATEWAY_PORT,
+                        help="Gateway serial port, e.g. COM5 or /dev/ttyUSB0 (default: auto-discovery)")
+    parser.add_argument('--log-url', default=LOG_URL,
+                        help="Logging server endpoint (default: %(default)s)")
+    parser.add_argument('--log-interval', type=float, default=LOG_INTERVAL * 1000,
+                        help="Ship command logs every this many ms (default: %(default)s)")
+    parser.add_argument('--journal', metavar='DIR', default=JOURNAL_DIR,
+                        help="Write every dispatched command to a binary journal in DIR "
+                             "(read it back with command_journal.load_journals)")
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help="Port of the HTTP metrics endpoint, 0 to disable (default: %(default)s)")
+    parser.add_argument('--metrics-dump', metavar='FILE', default=METRICS_DUMP,
+                        help="Write the latency report as JSON to FILE at shutdown")
+    parser.add_argument('--client', metavar='NAME:PRIORITY[:RATE]', action='append', default=[],
+                        help="Priority and optional rate limit (commands/s) of the client connecting as "
+                             "ws://localhost:9052/?client=NAME; higher priorities override lower ones "
+                             "per address. Repeat for several clients.")
+    parser.add_argument('--client-rate', type=float, default=CLIENT_RATE,
+                        help="Rate limit in commands/s of clients without --client, 0 = unlimited (default: %(default)s)")
+    parser.add_argument('--hold-time', type=float, default=CLAIM_HOLD_TIME * 1000,
+                        help="How long in ms a client keeps priority on the addresses it drove (default: %(default)s)")
+    args = parser.parse_args()
+    try:
+        CLIENT_POLICIES = dict(parse_client_policy(spec) for spec in args.client)
+    except ValueError as e:
+        parser.error(f"--client: {e}")
+    CLIENT_RATE = args.client_rate
+    CLAIM_HOLD_TIME = args.hold_time / 1000
+    METRICS_PORT = args.metrics_port
+    METRICS_DUMP = args.metrics_dump
+    JOURNAL_DIR = args.journal
+    LOG_URL = args.log_url
+    LOG_INTERVAL = args.log_interval / 1000
+    GATEWAY_PORT = args.port
+    TICK_RATE = args.tick_rate
+    BAUDRATE = args.baud
+    BATCH_THRESHOLD = args.batch_size
+    BATCH_LATENCY_BUDGET = args.latency_budget / 1000
+    motor_mirror.resend_after = args.resend_after
+
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,212 @@
+"""
+Batching pipeline between the WebSocket readers and the gateway.
+
+One BatchPipeline is owned by the server and shared by every connection:
+readers only submit() records, a single flusher task decides when a batch
+is due, and at most `max_in_flight` flush workers run at the same time.
+While all workers are busy the next batch keeps coalescing (latest command
+per actuator wins) instead of piling up more tasks. Actuators are told apart
+by their routed (slave_id, device addr), so the same address on two slaves
+is two commands.
+"""
+import asyncio
+
+
+class BatchPipeline:
+    def __init__(self, flush, topology, batch_size=10, latency_budget=0.2, max_in_flight=2):
+        """
+        flush: coroutine function called with the list of
+        (slave_id, addr, duty, freq, mode) records of one batch.
+        """
+        self.flush = flush
+        self.topology = topology
+        self.batch_size = batch_size
+        self.latency_budget = latency_budget
+        self.max_in_flight = max_in_flight
+
+        # (slave_id, device addr) -> (slave_id, addr, duty, freq, mode)
+        self.batch = {}
+        self._wakeup = asyncio.Event()
+        self._deadline = None
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._flusher = None
+        self._workers = set()
+
+        self.flush_count = 0
+        self.command_count = 0
+        self.batch_sizes = {}   # commands per flush -> number of flushes
+
+    def start(self):
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Cancels the flusher, flushes what is pending and waits for the workers."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+
+        commands = self._take_batch()
+        if commands:
+            await self._flush(commands)
+        if self._workers:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+
+    def submit(self, records):
+        """
+        Adds records to the current batch. The first record arms the deadline
+        timer; reaching batch_size wakes the flusher right away.
+        """
+        if not records:
+            return
+        if not self.batch:
+            loop = asyncio.get_running_loop()
+            self._deadline = loop.call_at(loop.time() + self.latency_budget, self._wakeup.set)
+        for record in records:
+            self.batch[self.topology.route(record[0], record[1])] = record
+        if len(self.batch) >= self.batch_size:
+            self._wakeup.set()
+
+    def _take_batch(self):
+        commands = list(self.batch.values())
+        self.batch.clear()
+        if self._deadline is not None:
+            self._deadline.cancel()
+            self._deadline = None
+        return commands
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # Wait for a free worker first, so the batch keeps coalescing meanwhile
+            await self._slots.acquire()
+            self._wakeup.clear()
+            commands = self._take_batch()
+            if not commands:
+                self._slots.release()
+                continue
+
+            worker = asyncio.create_task(self._flush(commands))
+            self._workers.add(worker)
+            worker.add_done_callback(self._worker_done)
+
+    def _worker_done(self, worker):
+        self._workers.discard(worker)
+        self._slots.release()
+        if not worker.cancelled() and worker.exception() is not None:
+            print(f"❌ Error while flushing batch: {worker.exception()}")
+
+    async def _flush(self, commands):
+        self.flush_count += 1
+        self.command_count += len(commands)
+        self.batch_sizes[len(commands)] = self.batch_sizes.get(len(commands), 0) + 1
+        await self.flush(commands)
+
+    def stats(self):
+        return {
+            'flushes': self.flush_count,
+            'commands': self.command_count,
+            'batch_sizes': dict(sorted(self.batch_sizes.items())),
+        }
+
+
+class FrameTicker:
+    """
+    Fixed-rate alternative to BatchPipeline (same start/submit/stop interface).
+
+    Incoming records only update the desired state of each actuator. Every
+    1/rate seconds, the full desired state of every slave that changed since
+    the previous tick is flushed; slaves that did not change are not sent.
+    Ticks stay on a fixed grid, so airtime and latency do not depend on how
+    Unity spreads its updates. A tick that overruns skips the missed ones.
+    """
+    def __init__(self, flush, topology, rate=50.0):
+        """
+        flush: coroutine function called once per tick with the
+        (slave_id, addr, duty, freq, mode) records of the changed slaves.
+        """
+        self.flush = flush
+        self.topology = topology
+        self.period = 1.0 / rate
+
+        # slave_id -> {addr: (slave_id, addr, duty, freq, mode)}
+        self.desired = {}
+        self.dirty = set()
+        self._changed = asyncio.Event()
+        self._ticker = None
+
+        self.flush_count = 0
+        self.command_count = 0
+        self.batch_sizes = {}   # commands per tick -> number of ticks
+        self.missed_ticks = 0
+
+    def start(self):
+        if self._ticker is None:
+            self._ticker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._ticker is not None:
+            self._ticker.cancel()
+            try:
+                await self._ticker
+            except asyncio.CancelledError:
+                pass
+            self._ticker = None
+        await self._tick()
+
+    def submit(self, records):
+        for record in records:
+            slave_id, _ = self.topology.route(record[0], record[1])
+            slave_state = self.desired.setdefault(slave_id, {})
+            previous = slave_state.get(record[1])
+            if previous is None or previous[2:] != record[2:]:
+                slave_state[record[1]] = record
+                self.dirty.add(slave_id)
+        if self.dirty:
+            self._changed.set()
+
+    async def _tick(self):
+        if not self.dirty:
+            return
+        commands = [record for slave_id in sorted(self.dirty) for record in self.desired[slave_id].values()]
+        self.dirty.clear()
+        self._changed.clear()
+        self.flush_count += 1
+        self.command_count += len(commands)
+        self.batch_sizes[len(commands)] = self.batch_sizes.get(len(commands), 0) + 1
+        await self.flush(commands)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            # Sleep without ticking while nothing changes, then wait for the
+            # next slot on the tick grid.
+            await self._changed.wait()
+            now = loop.time()
+            if now > next_tick:
+                missed = int((now - next_tick) / self.period)
+                next_tick += (missed + 1) * self.period
+            await asyncio.sleep(next_tick - loop.time())
+            try:
+                await self._tick()
+            except Exception as e:
+                print(f"❌ Error while sending frame: {e}")
+            next_tick += self.period
+            overrun = loop.time() - next_tick
+            if overrun > 0:
+                skipped = int(overrun / self.period) + 1
+                self.missed_ticks += skipped
+                next_tick += skipped * self.period
+
+    def stats(self):
+        return {
+            'flushes': self.flush_count,
+            'commands': self.command_count,
+            'batch_sizes': dict(sorted(self.batch_sizes.items())),
+            'missed_ticks': self.missed_ticks,
+        }
@@ -0,0 +1,260 @@
+"""
+End-to-end benchmark of the bridge (TCPserverDebug.py) without hardware.
+
+Starts a GatewayEmulator, runs the bridge against it in a subprocess and
+drives it over WebSocket with traffic modeled on HapticsTest.cs: a 120-address
+belt whose duty pattern follows moving drones, sent diff-only (only the
+addresses that changed) at a frame rate drifting between 60 and 90 Hz, plus
+blinking bursts on obstacle events.
+
+Reported as JSON:
+  - messages/s sent and commands/s delivered to the emulated slaves,
+  - bridge CPU time per message,
+  - batch size distribution and per-stage latency (from the bridge's /metrics),
+  - end-to-end latency from WebSocket send to slave decode.
+
+Usage: python bench_bridge.py [--duration 10] [--binary] [--output results.json]
+                              [--bridge-args="--tick-rate 50"]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import aiohttp
+import websockets
+
+from gateway_emulator import GatewayEmulator
+from haptic_protocol import SUBPROTOCOL_BINARY_V1, encode_frame
+from latency_metrics import LatencyHistogram
+
+BELT_SIZE = 120              # addresses driven by HapticsTest.cs
+BASE_FREQ = 1
+DUTY_MAX = 14
+BRIDGE_URL = 'ws://localhost:9052'
+BRIDGE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'TCPserverDebug.py')
+
+
+class BeltModel:
+    """
+    Duty pattern of the belt: a few drones moving along it, each lighting up a
+    bump of neighbouring addresses, and occasional obstacle events blinking a
+    contiguous run of addresses at 3 Hz.
+    """
+    def __init__(self, drones=5, burst_interval=2.0, burst_length=0.5, burst_width=20, seed=0):
+        self.rng = random.Random(seed)
+        self.drones = [[self.rng.uniform(0, BELT_SIZE), self.rng.uniform(-20, 20)] for _ in range(drones)]
+        self.burst_interval = burst_interval
+        self.burst_length = burst_length
+        self.burst_width = burst_width
+        self.burst = None       # (start time, first addr)
+        self.next_burst = self._next_burst(0.0)
+        self.previous = [0] * BELT_SIZE
+        self.bursts = 0
+
+    def _next_burst(self, now):
+        return now + self.rng.expovariate(1 / self.burst_interval) if self.burst_interval > 0 else math.inf
+
+    def frame(self, now, dt):
+        """Returns [(addr, duty)] for the addresses that changed since the last frame."""
+        for drone in self.drones:
+            drone[0] = (drone[0] + drone[1] * dt) % BELT_SIZE
+            if self.rng.random() < dt:
+                drone[1] = self.rng.uniform(-20, 20)
+
+        duty = [0.0] * BELT_SIZE
+        for position, _ in self.drones:
+            for addr in range(int(position) - 6, int(position) + 7):
+                distance = addr - position
+                duty[addr % BELT_SIZE] += 6 * math.exp(-(distance / 3) ** 2)
+        duty = [min(DUTY_MAX, round(value)) for value in duty]
+
+        if self.burst is None and now >= self.next_burst:
+            self.burst = (now, self.rng.randrange(BELT_SIZE - self.burst_width))
+            self.bursts += 1
+        if self.burst is not None:
+            started, first = self.burst
+            if now - started > self.burst_length:
+                self.burst = None
+                self.next_burst = self._next_burst(now)
+            elif int((now - started) * 6) % 2 == 0:
+                for addr in range(first, first + self.burst_width):
+                    duty[addr] = max(duty[addr], 7)
+
+        changed = [(addr, value) for addr, value in enumerate(duty) if value != self.previous[addr]]
+        self.previous = duty
+        return changed
+
+
+class DeliveryTracker:
+    """Matches commands decoded by the emulator with the last one sent per address."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}       # addr -> (sent time, duty)
+        self.histogram = LatencyHistogram()
+        self.delivered = 0
+
+    def sent(self, addr, duty, now):
+        with self.lock:
+            self.pending[addr] = (now, duty)
+
+    def on_event(self, event):
+        addr = event.group * 8 + event.addr
+        duty = event.duty if event.is_start else 0
+        with self.lock:
+            self.delivered += 1
+            sent = self.pending.get(addr)
+            if sent is not None and sent[1] == duty:
+                del self.pending[addr]
+                self.histogram.record(event.t - sent[0])
+
+
+async def wait_for_bridge(process, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"bridge exited with code {process.returncode}")
+        try:
+            async with websockets.connect(BRIDGE_URL):
+                return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("bridge did not start in time")
+
+
+async def drive(args, tracker):
+    """Sends the belt traffic for args.duration seconds; returns (frames, messages, bursts)."""
+    model = BeltModel(burst_interval=args.burst_interval, seed=args.seed)
+    rng = random.Random(args.seed)
+    subprotocols = [SUBPROTOCOL_BINARY_V1] if args.binary else None
+    frames = messages = 0
+    async with websockets.connect(BRIDGE_URL, subprotocols=subprotocols, compression=None) as websocket:
+        start = last = time.monotonic()
+        next_frame = start
+        while last - start < args.duration:
+            await asyncio.sleep(max(0.0, next_frame - time.monotonic()))
+            now = time.monotonic()
+            changed = model.frame(now - start, now - last)
+            last = now
+            next_frame += 1 / rng.uniform(args.min_rate, args.max_rate)
+            frames += 1
+            if not changed:
+                continue
+
+            if args.binary:
+                await websocket.send(encode_frame([(None, addr, duty, BASE_FREQ, 1 if duty else 0)
+                                                   for addr, duty in changed]))
+                messages += 1
+            else:
+                for addr, duty in changed:
+                    await websocket.send(json.dumps({'addr': addr, 'mode': 1 if duty else 0,
+                                                     'duty': duty, 'freq': BASE_FREQ}))
+                messages += len(changed)
+            sent = time.monotonic()
+            for addr, duty in changed:
+                tracker.sent(addr, duty, sent)
+    return frames, messages, model.bursts
+
+
+async def fetch_metrics(port):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f'http://localhost:{port}/metrics') as response:
+            return await response.json()
+
+
+async def run(args):
+    tracker = DeliveryTracker()
+    emulator = GatewayEmulator(args.slaves, args.baud, on_event=tracker.on_event).start()
+    command = [sys.executable, BRIDGE_SCRIPT, '--port', emulator.port, '--baud', str(args.baud),
+               '--metrics-port', str(args.metrics_port), '--log-url', args.log_url] + shlex.split(args.bridge_args)
+    bridge = subprocess.Popen(command, stdout=subprocess.DEVNULL if not args.verbose else None,
+                              stderr=subprocess.STDOUT)
+    try:
+        await wait_for_bridge(bridge)
+        cpu_before = (await fetch_metrics(args.metrics_port))['cpu_s']
+        started = time.monotonic()
+        frames, messages, bursts = await drive(args, tracker)
+        elapsed = time.monotonic() - started
+        # Let the last batches reach the slaves before reading the counters
+        await asyncio.sleep(args.settle)
+        metrics = await fetch_metrics(args.metrics_port)
+    finally:
+        bridge.send_signal(signal.SIGINT)
+        try:
+            bridge.wait(10)
+        except subprocess.TimeoutExpired:
+            bridge.kill()
+            bridge.wait()
+        emulator.stop()
+
+    cpu = metrics['cpu_s'] - cpu_before
+    return {
+        'config': {
+            'duration_s': args.duration,
+            'frame_rate_hz': [args.min_rate, args.max_rate],
+            'protocol': 'binary' if args.binary else 'json',
+            'bridge_args': args.bridge_args,
+            'baudrate': args.baud,
+        },
+        'load': {
+            'frames': frames,
+            'bursts': bursts,
+            'messages': messages,
+            'messages_per_s': round(messages / elapsed, 1),
+        },
+        'delivery': {
+            'commands_decoded': tracker.delivered,
+            'commands_per_s': round(tracker.delivered / elapsed, 1),
+            'addresses_not_reached': len(tracker.pending),
+            'end_to_end': tracker.histogram.summary(),
+        },
+        'bridge': {
+            'cpu_s': round(cpu, 3),
+            'cpu_us_per_message': round(cpu / max(messages, 1) * 1e6, 1),
+            'pipeline': metrics['pipeline'],
+            'latency': metrics['latency']['all'],
+            'gateways': metrics['gateways'],
+            'motor_mirror': metrics['motor_mirror'],
+        },
+        'gateway': emulator.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Unity -> gateway bridge against an emulated gateway")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds of traffic (default: %(default)s)")
+    parser.add_argument('--min-rate', type=float, default=60.0, help="Lowest Unity frame rate in Hz (default: %(default)s)")
+    parser.add_argument('--max-rate', type=float, default=90.0, help="Highest Unity frame rate in Hz (default: %(default)s)")
+    parser.add_argument('--burst-interval', type=float, default=2.0,
+                        help="Mean seconds between obstacle bursts, 0 disables them (default: %(default)s)")
+    parser.add_argument('--binary', action='store_true', help="Send one binary frame per Unity frame instead of JSON")
+    parser.add_argument('--bridge-args', default='', help="Extra arguments for TCPserverDebug.py, e.g. \"--batch-size 20\"")
+    parser.add_argument('--slaves', type=int, default=2, help="Emulated slaves (default: %(default)s)")
+    parser.add_argument('--baud', type=int, default=115200, help="Emulated link speed (default: %(default)s)")
+    parser.add_argument('--metrics-port', type=int, default=9053)
+    parser.add_argument('--log-url', default='http://localhost:5000/commands')
+    parser.add_argument('--settle', type=float, default=0.5, help="Seconds to wait for the last commands (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true', help="Show the bridge's output")
+    parser.add_argument('--output', help="Write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark of the gateway command encoders: cost to encode 1,000 commands into
+framed packets with the legacy per-command encoder (create_command + +=), the
+precomputed lookup table (SERIAL_API.build_packet) and the NumPy batch encoder
+(encode_packets).
+
+Usage: python bench_encode.py [--commands 1000] [--repeat 200]
+"""
+import argparse
+import random
+import timeit
+
+import numpy as np
+
+from serial_api_flexible import (SERIAL_API, COMMANDS_PER_PACKET, PADDING,
+                                 encode_command, encode_packets)
+
+
+def legacy_build_packet(slave_id, commands):
+    """Encoder as it was before the lookup table: one bytearray per command."""
+    packets = bytearray()
+    for i in range(0, max(len(commands), 1), COMMANDS_PER_PACKET):
+        chunk = commands[i:i + COMMANDS_PER_PACKET]
+        payload = bytearray()
+        for addr, duty, freq, start_or_stop in chunk:
+            if not (0 <= addr <= 127 and 0 <= duty <= 15 and 0 <= freq <= 7 and start_or_stop in [0, 1]): return None
+            payload += bytearray(encode_command(int(addr), int(duty), int(freq), int(start_or_stop)))
+        padding_needed = COMMANDS_PER_PACKET - len(chunk)
+        if padding_needed > 0: payload += bytearray(PADDING) * padding_needed
+        packets += bytearray([slave_id]) + payload
+    return packets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark gateway command encoding")
+    parser.add_argument('--commands', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    commands = [(rng.randrange(128), rng.randrange(16), rng.randrange(8), rng.randrange(2))
+                for _ in range(args.commands)]
+    addrs, duties, freqs, modes = (np.array(column) for column in zip(*commands))
+    api = SERIAL_API()
+
+    expected = bytes(legacy_build_packet(0, commands))
+    assert api.build_packet(0, commands) == expected
+    assert encode_packets(0, addrs, duties, freqs, modes) == expected
+
+    encoders = {
+        'legacy (create_command)': lambda: legacy_build_packet(0, commands),
+        'lookup table (build_packet)': lambda: api.build_packet(0, commands),
+        'numpy (encode_packets)': lambda: encode_packets(0, addrs, duties, freqs, modes),
+    }
+    print(f"Encoding {args.commands} commands, best of 5 x {args.repeat} runs")
+    baseline = None
+    for name, encoder in encoders.items():
+        best = min(timeit.repeat(encoder, number=args.repeat, repeat=5)) / args.repeat
+        per_1000 = best * 1e6 * 1000 / args.commands
+        baseline = baseline or per_1000
+        print(f"  {name:<28} {per_1000:9.1f} us / 1000 commands  ({baseline / per_1000:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
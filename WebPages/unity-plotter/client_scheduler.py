@@ -0,0 +1,234 @@
+"""
+Fan-in of several WebSocket clients (Unity, calibration tool, test scripts)
+into the shared batching pipeline.
+
+Each connection gets a Client with its own input queue: the pending command
+per actuator, latest wins, like the rest of the bridge. Actuators are the
+routed (slave_id, device addr) pairs of the topology. A single scheduler task
+moves those commands into the pipeline:
+
+  - priority: clients are served from the highest priority down, and a client
+    claims the actuators it drives for `hold_time` seconds. Commands of a
+    lower-priority client for a claimed actuator are held back, the latest
+    one per actuator, and sent once the claim lapses or the claiming client
+    disconnects. So e.g. a calibration tool overrides experiment traffic on
+    the motors it touches, and the experiment takes them back in the state it
+    last asked for once the calibration stops.
+  - rate limit: a client with a rate only gets that many commands/s through
+    (token bucket). While it is throttled its updates keep coalescing in its
+    queue, so a noisy client sends its latest state at its own pace without
+    delaying the other clients or flooding the gateway.
+
+Clients name themselves in the connection URL, e.g.
+ws://localhost:9052/?client=calibration; priorities and rates are configured
+per name on the server.
+"""
+import asyncio
+import time
+from collections import namedtuple
+
+ClientPolicy = namedtuple('ClientPolicy', ['priority', 'rate'])
+DEFAULT_POLICY = ClientPolicy(priority=0, rate=0)
+
+
+def parse_client_policy(spec):
+    """'NAME:PRIORITY[:RATE]' -> (name, ClientPolicy); RATE in commands/s, 0 = unlimited."""
+    parts = spec.split(':')
+    if len(parts) not in (2, 3) or not parts[0]:
+        raise ValueError(f"expected NAME:PRIORITY[:RATE], got {spec!r}")
+    return parts[0], ClientPolicy(int(parts[1]), float(parts[2]) if len(parts) == 3 else 0)
+
+
+class Client:
+    def __init__(self, name, policy, burst_time=0.1):
+        self.name = name
+        self.priority = policy.priority
+        self.rate = policy.rate
+        # Up to burst_time seconds of commands may go through at once (at least one command)
+        self.burst = max(self.rate * burst_time, 1)
+        self.tokens = self.burst
+        self.refilled_at = time.monotonic()
+
+        # (slave_id, device addr) -> (slave_id, addr, duty, freq, mode) waiting for the scheduler
+        self.pending = {}
+        # (slave_id, device addr) -> latest record overridden by a higher-priority claim
+        self.held_back = {}
+        self.received = 0
+        self.forwarded = 0
+        self.coalesced = 0
+        self.overridden = 0
+
+    def refill(self, now):
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+    def take(self):
+        """Removes and returns the pending commands the rate limit allows now."""
+        count = len(self.pending) if self.rate <= 0 else min(len(self.pending), int(self.tokens))
+        if count == len(self.pending):
+            records = list(self.pending.values())
+            self.pending.clear()
+        else:
+            keys = list(self.pending)[:count]
+            records = [self.pending.pop(key) for key in keys]
+        if self.rate > 0:
+            self.tokens -= count
+        return records
+
+    def next_token_in(self):
+        return (1 - self.tokens) / self.rate if self.rate > 0 and self.tokens < 1 else 0.0
+
+
+class ClientScheduler:
+    def __init__(self, submit, topology, policies=None, default_rate=0, hold_time=0.5):
+        """
+        submit: function called with the (slave_id, addr, duty, freq, mode)
+        records to pass on (the pipeline's submit).
+        topology: routes the records to the actuators that are queued and claimed.
+        policies: {client name: ClientPolicy}; other clients get priority 0
+        and default_rate.
+        """
+        self.submit_records = submit
+        self.topology = topology
+        self.policies = policies or {}
+        self.default_rate = default_rate
+        self.hold_time = hold_time
+
+        self.clients = []
+        # (slave_id, device addr) -> (client, claimed until) for the last client that drove it
+        self.claims = {}
+        self._wakeup = asyncio.Event()
+        self._scheduler = None
+        self._retry = None
+
+    def connect(self, name=None):
+        name = name or f'client-{len(self.clients)}'
+        client = Client(name, self.policies.get(name, DEFAULT_POLICY._replace(rate=self.default_rate)))
+        self.clients.append(client)
+        # Highest priority first; equal priorities in connection order
+        self.clients.sort(key=lambda c: -c.priority)
+        return client
+
+    def disconnect(self, client):
+        """
+        Drops what the client still had queued and releases its actuators:
+        commands other clients held back for them are sent again.
+        """
+        self.clients.remove(client)
+        self.claims = {key: claim for key, claim in self.claims.items() if claim[0] is not client}
+        self._wakeup.set()
+
+    def submit(self, client, records):
+        for record in records:
+            key = self.topology.route(record[0], record[1])
+            if key in client.pending:
+                client.coalesced += 1
+            client.pending[key] = record
+            # A newer command replaces the one waiting for a claim to lapse
+            client.held_back.pop(key, None)
+        client.received += len(records)
+        if records:
+            self._wakeup.set()
+
+    def start(self):
+        if self._scheduler is None:
+            self._scheduler = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            try:
+                await self._scheduler
+            except asyncio.CancelledError:
+                pass
+            self._scheduler = None
+        self._schedule()
+
+    def _blocking_claim(self, client, key, now):
+        """The active claim of a higher-priority client on key, or None."""
+        claim = self.claims.get(key)
+        if (claim is not None and claim[0] is not client and claim[1] > now
+                and claim[0].priority > client.priority):
+            return claim
+        return None
+
+    def _restore(self, client, now):
+        """
+        Queues the client's held-back commands whose claim lapsed again.
+        Returns how long until the next claim on one of them lapses, or None.
+        """
+        next_lapse = None
+        for key, record in list(client.held_back.items()):
+            claim = self._blocking_claim(client, key, now)
+            if claim is None:
+                del client.held_back[key]
+                client.pending.setdefault(key, record)
+            else:
+                wait = claim[1] - now
+                next_lapse = wait if next_lapse is None else min(next_lapse, wait)
+        return next_lapse
+
+    def _schedule(self):
+        """
+        One round over the clients; returns how long until a throttled client
+        may send again or a claim on a held-back command lapses.
+        """
+        now = time.monotonic()
+        retry_in = None
+        for client in self.clients:
+            if client.held_back:
+                wait = self._restore(client, now)
+                if wait is not None:
+                    retry_in = wait if retry_in is None else min(retry_in, wait)
+            if not client.pending:
+                continue
+            client.refill(now)
+            records = []
+            for record in client.take():
+                key = self.topology.route(record[0], record[1])
+                claim = self._blocking_claim(client, key, now)
+                if claim is not None:
+                    client.overridden += 1
+                    client.held_back[key] = record
+                    wait = claim[1] - now
+                    retry_in = wait if retry_in is None else min(retry_in, wait)
+                    continue
+                self.claims[key] = (client, now + self.hold_time)
+                records.append(record)
+            if records:
+                client.forwarded += len(records)
+                self.submit_records(records)
+            if client.pending:
+                wait = client.next_token_in()
+                retry_in = wait if retry_in is None else min(retry_in, wait)
+        return retry_in
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            retry_in = self._schedule()
+            if self._retry is not None:
+                self._retry.cancel()
+                self._retry = None
+            if retry_in is not None:
+                # Throttled clients still have commands, or held-back ones wait
+                # for a claim: come back when they may be sent
+                self._retry = asyncio.get_running_loop().call_later(retry_in, self._wakeup.set)
+
+    def stats(self):
+        return [
+            {
+                'name': client.name,
+                'priority': client.priority,
+                'rate': client.rate,
+                'received': client.received,
+                'forwarded': client.forwarded,
+                'coalesced': client.coalesced,
+                'overridden': client.overridden,
+                'pending': len(client.pending),
+                'held_back': len(client.held_back),
+            }
+            for client in self.clients
+        ]
@@ -0,0 +1,115 @@
+"""
+Append-only binary journal of every command dispatched to the gateway.
+
+Each record is 16 bytes: wall-clock timestamp (float64), slave_id, addr,
+duty, freq, mode (uint8 each) and 3 padding bytes. Files start with a 16-byte
+header and rotate once they reach `max_bytes`:
+
+    journal-<session>-000.bin, journal-<session>-001.bin, ...
+
+load_journal() memory-maps a file into a NumPy structured array, so hours of
+commands load in milliseconds:
+
+    from command_journal import load_journals
+    commands = load_journals('journals/journal-20250101-120000-*.bin')
+    commands[commands['addr'] == 12]['duty']
+
+Run `python command_journal.py <files>` for a quick summary.
+"""
+import glob
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+JOURNAL_MAGIC = b'HJNL'
+JOURNAL_VERSION = 1
+HEADER = struct.Struct('<4sHHd')   # magic, version, record size, session start time
+RECORD = struct.Struct('<d5B3x')
+JOURNAL_DTYPE = np.dtype([
+    ('timestamp', '<f8'), ('slave_id', 'u1'), ('addr', 'u1'),
+    ('duty', 'u1'), ('freq', 'u1'), ('mode', 'u1'), ('_pad', 'V3'),
+])
+assert JOURNAL_DTYPE.itemsize == RECORD.size == HEADER.size
+
+
+class CommandJournal:
+    def __init__(self, directory, session=None, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.session = session or time.strftime('%Y%m%d-%H%M%S')
+        self.max_bytes = max_bytes
+        self.started_at = time.time()
+
+        self.file = None
+        self.file_index = -1
+        self.file_size = 0
+        self.records_written = 0
+        os.makedirs(directory, exist_ok=True)
+        self._rotate()
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f'journal-{self.session}-{self.file_index:03d}.bin')
+
+    def _rotate(self):
+        if self.file is not None:
+            self.file.close()
+        self.file_index += 1
+        self.file = open(self.path, 'wb')
+        self.file.write(HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, RECORD.size, self.started_at))
+        self.file_size = HEADER.size
+
+    def write(self, slave_id, commands, timestamp=None):
+        """Appends (addr, duty, freq, mode) commands sent to one slave."""
+        if not commands:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        data = bytearray(RECORD.size * len(commands))
+        for i, (addr, duty, freq, mode) in enumerate(commands):
+            RECORD.pack_into(data, i * RECORD.size, timestamp, slave_id, addr, duty, freq, mode)
+        if self.file_size + len(data) > self.max_bytes:
+            self._rotate()
+        self.file.write(data)
+        self.file_size += len(data)
+        self.records_written += len(commands)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def load_journal(path):
+    """Memory-maps one journal file as a read-only structured array."""
+    with open(path, 'rb') as f:
+        magic, version, record_size, _ = HEADER.unpack(f.read(HEADER.size))
+    if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION or record_size != RECORD.size:
+        raise ValueError(f"{path} is not a version {JOURNAL_VERSION} command journal")
+
+    # A journal cut short by a crash may end with a partial record: ignore it
+    count = (os.path.getsize(path) - HEADER.size) // RECORD.size
+    if count == 0:
+        return np.empty(0, dtype=JOURNAL_DTYPE)
+    return np.memmap(path, dtype=JOURNAL_DTYPE, mode='r', offset=HEADER.size, shape=(count,))
+
+
+def load_journals(pattern):
+    """Loads every journal file matching a glob pattern, in rotation order."""
+    parts = [load_journal(path) for path in sorted(glob.glob(pattern))]
+    if not parts:
+        return np.empty(0, dtype=JOURNAL_DTYPE)
+    return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        records = load_journal(path)
+        if len(records) == 0:
+            print(f"{path}: empty")
+            continue
+        duration = records['timestamp'][-1] - records['timestamp'][0]
+        print(f"{path}: {len(records)} commands over {duration:.1f}s, "
+              f"slaves {sorted(set(records['slave_id'].tolist()))}, "
+              f"{len(np.unique(records['addr']))} addresses")
@@ -0,0 +1,161 @@
+"""
+Software stand-in for the ESP-NOW gateway and its slaves (Linux/macOS).
+
+Opens a pseudo-terminal that behaves like the gateway's USB serial port:
+  - framing of ESP_Setup/master.ino: 1-byte slave id + 60-byte payload,
+    BROADCAST_ID (255) goes to every slave, ids without a slave are dropped,
+    PROBE_ID (254) is answered with the ready line;
+  - decoding of slave.ino's processMotorData for every delivered payload;
+  - the UART timing of the configured baud rate (10 bits per byte).
+
+Every decoded motor command is recorded with its time.monotonic() timestamp,
+so the bridge and SERIAL_API can be benchmarked and regression-tested without
+hardware:
+
+    emulator = GatewayEmulator(num_slaves=2)
+    emulator.start()
+    api.connect_serial_device(emulator.port)
+    ...
+    emulator.timeline      # [(t, slave, group, addr, is_start, duty, freq, wave), ...]
+    emulator.motor_states  # {(slave, group, addr): (is_start, duty, freq, wave)}
+
+Standalone: python gateway_emulator.py [--slaves 2] [--baud 115200],
+then start the bridge with --port <printed port>.
+"""
+import argparse
+import os
+import pty
+import select
+import threading
+import time
+import tty
+from collections import namedtuple
+
+from serial_api_flexible import PACKET_SIZE, PAYLOAD_SIZE, PROBE_ID, READY_LINE
+
+BROADCAST_ID = 255
+
+MotorEvent = namedtuple('MotorEvent', ['t', 'slave', 'group', 'addr', 'is_start', 'duty', 'freq', 'wave'])
+
+
+def decode_payload(payload):
+    """
+    processMotorData from slave.ino: 3-byte commands, 0xFF first byte is padding.
+    Yields (serial_group, addr, is_start, duty, freq, wave).
+    """
+    if len(payload) % 3 != 0:
+        return
+    for i in range(0, len(payload), 3):
+        byte1 = payload[i]
+        if byte1 == 0xFF:
+            continue
+        byte2 = payload[i + 1]
+        byte3 = payload[i + 2]
+        yield ((byte1 >> 2) & 0x0F, byte2 & 0x3F, byte1 & 0x01,
+               (byte3 >> 3) & 0x0F, (byte3 >> 1) & 0x03, byte3 & 0x01)
+
+
+class GatewayEmulator:
+    def __init__(self, num_slaves=2, baudrate=115200, on_event=None):
+        self.num_slaves = num_slaves
+        self.byte_time = 10 / baudrate if baudrate else 0.0
+        self.on_event = on_event
+
+        self.master_fd, self.slave_fd = pty.openpty()
+        # Raw mode: no echo or line editing between the two ends
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+
+        self.timeline = []
+        self.motor_states = {}
+        self.packets = 0
+        self.dropped_packets = 0
+        self.bytes_received = 0
+
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='GatewayEmulator', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(1)
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+    def _run(self):
+        buffer = bytearray()
+        link_free_at = 0.0
+        while self._running:
+            ready, _, _ = select.select([self.master_fd], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master_fd, 4096)
+            except OSError:
+                return
+            # A chunk is only fully received once the UART had time to shift it in
+            now = time.monotonic()
+            link_free_at = max(now, link_free_at) + len(data) * self.byte_time
+            if link_free_at > now:
+                time.sleep(link_free_at - now)
+            self.bytes_received += len(data)
+            buffer += data
+
+            while len(buffer) >= PACKET_SIZE:
+                self._handle_packet(buffer[0], bytes(buffer[1:PACKET_SIZE]))
+                del buffer[:PACKET_SIZE]
+
+    def _handle_packet(self, target_slave_id, payload):
+        self.packets += 1
+        if target_slave_id == PROBE_ID:
+            os.write(self.master_fd, READY_LINE + b'\r\n')
+            return
+        if target_slave_id == BROADCAST_ID:
+            slaves = range(self.num_slaves)
+        elif target_slave_id < self.num_slaves:
+            slaves = (target_slave_id,)
+        else:
+            self.dropped_packets += 1
+            return
+
+        now = time.monotonic()
+        for slave in slaves:
+            for group, addr, is_start, duty, freq, wave in decode_payload(payload[:PAYLOAD_SIZE]):
+                event = MotorEvent(now, slave, group, addr, is_start, duty, freq, wave)
+                self.timeline.append(event)
+                # A stop command carries no duty/freq (see sendCommand in slave.ino)
+                self.motor_states[slave, group, addr] = (is_start, duty, freq, wave) if is_start else (0, 0, 0, 0)
+                if self.on_event is not None:
+                    self.on_event(event)
+
+    def stats(self):
+        return {
+            'packets': self.packets,
+            'dropped_packets': self.dropped_packets,
+            'bytes_received': self.bytes_received,
+            'motor_commands': len(self.timeline),
+            'active_motors': sum(1 for state in self.motor_states.values() if state[0]),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Virtual ESP-NOW gateway on a pseudo-terminal")
+    parser.add_argument('--slaves', type=int, default=2, help="Number of slaves (default: %(default)s)")
+    parser.add_argument('--baud', type=int, default=115200, help="Emulated baud rate (default: %(default)s)")
+    args = parser.parse_args()
+
+    emulator = GatewayEmulator(args.slaves, args.baud).start()
+    print(f"✅ Virtual gateway on {emulator.port} ({args.slaves} slaves, {args.baud} baud)")
+    print(f"   Start the bridge with: python TCPserverDebug.py --port {emulator.port}")
+    try:
+        while True:
+            time.sleep(5)
+            print(emulator.stats())
+    except KeyboardInterrupt:
+        emulator.stop()
@@ -0,0 +1,74 @@
+"""
+One gateway ESP32 as seen by the bridge: its SERIAL_API connection, serial
+writer thread and LinkGovernor.
+
+Each gateway gets its own GatewayLink, so several gateways are paced and
+written concurrently and independently: a busy link only delays the slaves
+behind it. Slave ids stay global in the bridge (motor mirror, latency,
+journal); local_id() translates them to the id the gateway knows the slave by.
+"""
+import asyncio
+
+from serial_api_flexible import SERIAL_API
+from link_governor import LinkGovernor
+
+
+class GatewayLink:
+    def __init__(self, index, port=None, slaves=None):
+        """
+        port: serial port of the gateway, None for auto-discovery.
+        slaves: global slave ids behind this gateway, in the gateway's order
+        (None: ids are used as they are).
+        """
+        self.index = index
+        self.port = port
+        self.local_ids = {slave_id: local_id for local_id, slave_id in enumerate(slaves)} if slaves else None
+        self.api = SERIAL_API()
+        self.governor = None
+
+    @property
+    def name(self):
+        return f"gateway #{self.index} ({self.port or 'not connected'})"
+
+    @property
+    def connected(self):
+        return self.api.connected
+
+    def local_id(self, slave_id):
+        if self.local_ids is None:
+            return slave_id
+        return self.local_ids.get(slave_id, slave_id)
+
+    async def connect(self, baudrate, exclude=()):
+        """Connects to the configured port, or discovers a gateway on the ports not in exclude."""
+        if self.port:
+            print(f"Connecting to gateway #{self.index} on {self.port}...")
+            return await asyncio.to_thread(self.api.connect_serial_device, self.port, baudrate)
+        print(f"Looking for gateway #{self.index} on: {self.api.get_serial_devices()}")
+        connected = await asyncio.to_thread(self.api.discover_gateway, baudrate, exclude=exclude)
+        if connected:
+            self.port = self.api.serial_connection.port
+        return connected
+
+    def start(self, send, filter_commands, baudrate, queue_size):
+        """
+        send: coroutine function (link, {slave_id: commands}) doing the writes
+        for this gateway once its governor releases them.
+        """
+        self.api.start_writer(queue_size)
+        self.governor = LinkGovernor(lambda per_slave: send(self, per_slave), filter_commands, baudrate)
+        self.governor.start()
+
+    async def stop(self):
+        if self.governor is not None:
+            await self.governor.stop()
+
+    def disconnect(self):
+        self.api.disconnect_serial_device()
+
+    def stats(self):
+        return {
+            'port': self.port,
+            'link': self.governor.stats() if self.governor else None,
+            'serial_writer': self.api.writer.stats() if self.api.writer else None,
+        }
@@ -0,0 +1,149 @@
+"""
+Binary WebSocket frame format for haptic commands (Unity -> TCPserverDebug).
+
+A client that negotiates the "haptic-bin.v1" WebSocket subprotocol may send a
+whole haptic frame as ONE binary message instead of one JSON text message per
+actuator. Legacy JSON text messages stay accepted on every connection.
+
+Frame layout (little endian):
+    header  : magic 'H' (uint8) | version (uint8) | record count (uint16)
+    records : count x 5 bytes -> slave_id, addr, duty, freq, mode (uint8 each)
+
+A slave_id of AUTO_SLAVE (0xFE) means "no slave given", exactly like a JSON
+message without a 'slave_id' key.
+
+Both paths decode to the same command record, a (slave_id, addr, duty, freq,
+mode) tuple, which the bridge keeps as-is until it is encoded for the gateway.
+Records are range-checked here, at ingress: the gateway packet builder
+rejects a whole slave's packet for one bad command, so an invalid record is
+dropped on its own before it can be coalesced with valid ones.
+"""
+import json
+import struct
+
+SUBPROTOCOL_BINARY_V1 = "haptic-bin.v1"
+SUBPROTOCOL_JSON = "haptic-json"
+SUPPORTED_SUBPROTOCOLS = [SUBPROTOCOL_BINARY_V1, SUBPROTOCOL_JSON]
+
+FRAME_MAGIC = 0x48  # 'H'
+FRAME_VERSION = 1
+AUTO_SLAVE = 0xFE
+
+HEADER = struct.Struct('<BBH')
+RECORD = struct.Struct('<5B')
+MAX_RECORDS = 0xFFFF
+
+# Field ranges of the gateway command encoding (see SERIAL_API.build_packet).
+# addr is the Unity address: the topology maps it to a device address 0-127.
+MAX_ADDR = 0xFF
+MAX_DUTY = 15
+MAX_FREQ = 7
+BROADCAST_SLAVE = 0xFF
+# 0xFE is AUTO_SLAVE here and the readiness probe id on the gateway link
+MAX_SLAVE = 0xFD
+
+
+def select_subprotocol(connection, subprotocols):
+    """
+    websockets.serve() hook: picks the first supported subprotocol offered by
+    the client, or None so that legacy clients (offering none) still connect.
+    """
+    for subprotocol in SUPPORTED_SUBPROTOCOLS:
+        if subprotocol in subprotocols:
+            return subprotocol
+    return None
+
+
+class ProtocolError(ValueError):
+    """Raised when a binary frame or a command does not follow the format above."""
+
+
+def check_record(record):
+    """Raises ProtocolError if a field of a (slave_id, addr, duty, freq, mode) record is out of range."""
+    slave_id, addr, duty, freq, mode = record
+    if slave_id is not None and not (0 <= slave_id <= MAX_SLAVE or slave_id == BROADCAST_SLAVE):
+        raise ProtocolError(f"invalid slave_id {slave_id}")
+    if not 0 <= addr <= MAX_ADDR:
+        raise ProtocolError(f"addr {addr} out of range 0-{MAX_ADDR}")
+    if not 0 <= duty <= MAX_DUTY:
+        raise ProtocolError(f"duty {duty} out of range 0-{MAX_DUTY}")
+    if not 0 <= freq <= MAX_FREQ:
+        raise ProtocolError(f"freq {freq} out of range 0-{MAX_FREQ}")
+    if mode not in (0, 1):
+        raise ProtocolError(f"mode {mode} is neither 0 nor 1")
+    return record
+
+
+def decode_frame(data):
+    """
+    Decodes a binary frame. Returns (records, rejected): the valid
+    (slave_id, addr, duty, freq, mode) tuples, with slave_id None when the
+    record used AUTO_SLAVE, and the errors of the records that were out of
+    range and dropped. A malformed frame raises ProtocolError.
+    """
+    if len(data) < HEADER.size:
+        raise ProtocolError(f"frame too short ({len(data)} bytes)")
+
+    magic, version, count = HEADER.unpack_from(data)
+    if magic != FRAME_MAGIC:
+        raise ProtocolError(f"bad magic 0x{magic:02X}")
+    if version != FRAME_VERSION:
+        raise ProtocolError(f"unsupported frame version {version}")
+
+    expected = HEADER.size + count * RECORD.size
+    if len(data) != expected:
+        raise ProtocolError(f"frame length {len(data)} != {expected} for {count} records")
+
+    body = memoryview(data)[HEADER.size:]
+    records = []
+    rejected = []
+    for slave, addr, duty, freq, mode in RECORD.iter_unpack(body):
+        record = (None if slave == AUTO_SLAVE else slave, addr, duty, freq, mode)
+        try:
+            records.append(check_record(record))
+        except ProtocolError as e:
+            rejected.append(e)
+    return records, rejected
+
+
+def encode_frame(records):
+    """
+    Encodes an iterable of (slave_id, addr, duty, freq, mode) into a binary
+    frame. A slave_id of None is sent as AUTO_SLAVE.
+    """
+    records = list(records)
+    if len(records) > MAX_RECORDS:
+        raise ProtocolError(f"too many records for one frame ({len(records)})")
+
+    frame = bytearray(HEADER.size + len(records) * RECORD.size)
+    HEADER.pack_into(frame, 0, FRAME_MAGIC, FRAME_VERSION, len(records))
+    offset = HEADER.size
+    for slave, addr, duty, freq, mode in records:
+        RECORD.pack_into(frame, offset, AUTO_SLAVE if slave is None else slave, addr, duty, freq, mode)
+        offset += RECORD.size
+    return bytes(frame)
+
+
+def decode_json_message(message):
+    """
+    Decodes one legacy JSON text message. Returns (record, control):
+    record is a (slave_id, addr, duty, freq, mode) tuple for command messages,
+    control is the value of the 'control' key for control messages such as
+    {"control": "resync"}. Both are None for messages without an 'addr'.
+    Raises ProtocolError for a command with missing or out-of-range fields.
+    """
+    msg_obj = json.loads(message)
+    if not isinstance(msg_obj, dict):
+        raise ProtocolError(f"expected a JSON object, got {msg_obj!r}")
+    if 'control' in msg_obj:
+        return None, msg_obj['control']
+    addr = msg_obj.get('addr')
+    if addr is None:
+        return None, None
+    slave_id = msg_obj.get('slave_id')
+    try:
+        record = (None if slave_id is None else int(slave_id), int(addr), int(msg_obj['duty']),
+                  int(msg_obj['freq']), int(msg_obj['mode']))
+    except (KeyError, TypeError, ValueError) as e:
+        raise ProtocolError(f"invalid command {msg_obj}: {e!r}") from None
+    return check_record(record), None
@@ -0,0 +1,142 @@
+"""
+End-to-end latency instrumentation for the bridge.
+
+Every command is stamped with time.monotonic() as it moves through the
+bridge, keyed by (slave_id, device addr):
+
+    received   WebSocket message decoded            (collect_messages)
+    flushed    batch handed to the link governor    (send_commands_via_serial)
+    released   governor lets it go to the gateway   (send_to_slaves)
+    encoded    packet built and queued for writing  (SERIAL_API.send_commands_async)
+    written    serial write completed               (awaited in send_to_slaves)
+
+The time between two stamps goes into a log-bucketed histogram per stage
+and per slave ('batching', 'pacing', 'encode', 'write', 'end_to_end').
+Recording a sample is O(1) and memory does not grow with the session.
+"""
+import json
+import math
+import time
+
+# Buckets grow by 2**(1/8) (~9%) from 1 us, so percentiles are within ~9%
+BUCKETS_PER_OCTAVE = 8
+MIN_SECONDS = 1e-6
+BUCKET_COUNT = BUCKETS_PER_OCTAVE * 28   # up to ~268 s
+
+STAGES = ('batching', 'pacing', 'encode', 'write', 'end_to_end')
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds, weight=1):
+        if seconds <= MIN_SECONDS:
+            bucket = 0
+        else:
+            bucket = min(int(math.log2(seconds / MIN_SECONDS) * BUCKETS_PER_OCTAVE) + 1, BUCKET_COUNT - 1)
+        self.counts[bucket] += weight
+        self.count += weight
+        self.total += seconds * weight
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """Upper edge of the bucket holding the p-th percentile, in seconds."""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(MIN_SECONDS * 2 ** (bucket / BUCKETS_PER_OCTAVE), self.max)
+        return self.max
+
+    def summary(self):
+        """Count and p50/p95/p99/max/mean in milliseconds."""
+        return {
+            'count': self.count,
+            'p50_ms': round(self.percentile(50) * 1000, 3),
+            'p95_ms': round(self.percentile(95) * 1000, 3),
+            'p99_ms': round(self.percentile(99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+            'mean_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+        }
+
+
+class LatencyTracker:
+    def __init__(self):
+        # (stage, slave_id) -> histogram; slave_id None aggregates all slaves
+        self.histograms = {}
+        # (slave_id, addr) -> receipt time of the command currently pending for it
+        self.received_at = {}
+        # (slave_id, addr) -> (received, flushed) while queued in the governor
+        self.flushed_at = {}
+        self.started_at = time.monotonic()
+
+    def _record(self, stage, slave_id, seconds, weight=1):
+        for key in ((stage, slave_id), (stage, None)):
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = LatencyHistogram()
+            histogram.record(seconds, weight)
+
+    def received(self, keys, now=None):
+        """keys: (slave_id, device addr) of the records of one message."""
+        now = time.monotonic() if now is None else now
+        for key in keys:
+            self.received_at[key] = now
+
+    def flushed(self, per_slave, now=None):
+        now = time.monotonic() if now is None else now
+        for slave_id, commands in per_slave.items():
+            for command in commands:
+                key = (slave_id, command[0])
+                received = self.received_at.pop(key, now)
+                self._record('batching', slave_id, now - received)
+                self.flushed_at[key] = (received, now)
+
+    def released(self, slave_id, commands, now=None):
+        """Returns the stamps of these commands, to be passed to written()."""
+        now = time.monotonic() if now is None else now
+        stamps = []
+        for command in commands:
+            received, flushed = self.flushed_at.pop((slave_id, command[0]), (now, now))
+            self._record('pacing', slave_id, now - flushed)
+            stamps.append(received)
+        return now, stamps
+
+    def written(self, slave_id, stamps, encoded, now=None):
+        now = time.monotonic() if now is None else now
+        released, received_times = stamps
+        weight = len(received_times)
+        self._record('encode', slave_id, encoded - released, weight)
+        self._record('write', slave_id, now - encoded, weight)
+        for received in received_times:
+            self._record('end_to_end', slave_id, now - received)
+
+    def report(self):
+        """{'all': {stage: summary}, 'slaves': {slave_id: {stage: summary}}}"""
+        report = {'uptime_s': round(time.monotonic() - self.started_at, 1), 'all': {}, 'slaves': {}}
+        slaves = sorted({slave_id for _, slave_id in self.histograms if slave_id is not None})
+        for stage in STAGES:
+            if (stage, None) in self.histograms:
+                report['all'][stage] = self.histograms[stage, None].summary()
+            for slave_id in slaves:
+                if (stage, slave_id) in self.histograms:
+                    report['slaves'].setdefault(str(slave_id), {})[stage] = self.histograms[stage, slave_id].summary()
+        return report
+
+    def print_report(self):
+        print("Latency per stage (ms):       count      p50      p95      p99      max")
+        for stage, summary in self.report()['all'].items():
+            print(f"  {stage:<26} {summary['count']:>7} {summary['p50_ms']:>8.2f} {summary['p95_ms']:>8.2f} "
+                  f"{summary['p99_ms']:>8.2f} {summary['max_ms']:>8.2f}")
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
@@ -0,0 +1,127 @@
+"""
+Pacing governor between the bridge and the gateway's serial link.
+
+At 115200 baud (8N1, 10 bits per byte) one 61-byte packet occupies ~5.3 ms
+of UART time, so the gateway cannot take more than ~190 packets/s. The
+governor models that link: it only releases commands while the data already
+handed to the port is below `max_backlog` seconds of transmission time. While
+the link is busy, pending commands are coalesced per address (latest wins),
+so overload sends slightly older but current states instead of building up a
+backlog of stale vibrations.
+"""
+import asyncio
+import time
+
+from serial_api_flexible import COMMANDS_PER_PACKET, PACKET_SIZE
+
+
+class LinkGovernor:
+    def __init__(self, send, filter_commands=None, baudrate=115200, packet_size=PACKET_SIZE,
+                 bits_per_byte=10, max_backlog=0.02):
+        """
+        send: coroutine function taking {slave_id: [(addr, duty, freq, mode), ...]}.
+        filter_commands: optional function (slave_id, commands) -> commands applied to
+        non-forced commands right before they are sent.
+        """
+        self.send = send
+        self.filter_commands = filter_commands
+        self.baudrate = baudrate
+        self.packet_time = packet_size * bits_per_byte / baudrate
+        self.max_backlog = max_backlog
+
+        # slave_id -> {addr: ((addr, duty, freq, mode), force)}
+        self.pending = {}
+        self._wakeup = asyncio.Event()
+        self._drainer = None
+        self.link_free_at = 0.0
+
+        self.started_at = time.monotonic()
+        self.busy_time = 0.0
+        self.packets_sent = 0
+        self.commands_sent = 0
+        self.coalesced = 0
+
+    @property
+    def capacity(self):
+        """Packets per second the link can carry."""
+        return 1.0 / self.packet_time
+
+    def start(self):
+        if self._drainer is None:
+            self.started_at = time.monotonic()
+            self._drainer = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stops pacing and sends whatever is still pending."""
+        if self._drainer is not None:
+            self._drainer.cancel()
+            try:
+                await self._drainer
+            except asyncio.CancelledError:
+                pass
+            self._drainer = None
+        await self._send_pending()
+
+    def submit(self, per_slave, force=False):
+        """
+        Queues {slave_id: [(addr, duty, freq, mode), ...]}. A newer command for
+        an address replaces the pending one. Forced commands skip the filter.
+        """
+        for slave_id, commands in per_slave.items():
+            pending = self.pending.setdefault(slave_id, {})
+            for command in commands:
+                if command[0] in pending:
+                    self.coalesced += 1
+                pending[command[0]] = (command, force)
+        if per_slave:
+            self._wakeup.set()
+
+    def _take_pending(self):
+        per_slave = {}
+        for slave_id, pending in self.pending.items():
+            forced = [command for command, force in pending.values() if force]
+            normal = [command for command, force in pending.values() if not force]
+            if self.filter_commands is not None and normal:
+                normal = self.filter_commands(slave_id, normal)
+            if forced or normal:
+                per_slave[slave_id] = forced + normal
+        self.pending.clear()
+        return per_slave
+
+    async def _send_pending(self):
+        per_slave = self._take_pending()
+        if not per_slave:
+            return
+        packets = sum(-(-len(commands) // COMMANDS_PER_PACKET) for commands in per_slave.values())
+        now = time.monotonic()
+        self.link_free_at = max(now, self.link_free_at) + packets * self.packet_time
+        self.busy_time += packets * self.packet_time
+        self.packets_sent += packets
+        self.commands_sent += sum(len(commands) for commands in per_slave.values())
+        await self.send(per_slave)
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # Let the link drain down to the allowed backlog; meanwhile new
+            # commands keep coalescing into self.pending.
+            wait = self.link_free_at - self.max_backlog - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._wakeup.clear()
+            try:
+                await self._send_pending()
+            except Exception as e:
+                print(f"❌ Error while sending to the gateway: {e}")
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return {
+            'baudrate': self.baudrate,
+            'capacity_packets_per_s': round(self.capacity, 1),
+            'packets_sent': self.packets_sent,
+            'commands_sent': self.commands_sent,
+            'coalesced': self.coalesced,
+            'utilization': round(self.busy_time / elapsed, 3),
+            'backlog_ms': round(max(0.0, self.link_free_at - time.monotonic()) * 1000, 1),
+        }
@@ -0,0 +1,90 @@
+"""
+Mirror of the motor states on every slave, used to drop redundant commands.
+
+Unity sends a command whenever it thinks an actuator changed, but often the
+motor is already in that state. The mirror remembers, per slave and device
+address, the last state the gateway accepted and when it was sent, so that
+identical commands can be dropped before they use the 115200-baud link.
+
+ESP-NOW does not acknowledge delivery to the slaves, so an identical command
+is still forwarded once its state is older than `resend_after` seconds; a
+lost packet can never leave a motor stuck for longer than that.
+
+Broadcast commands reach every slave: they are always forwarded, and once
+accepted they become the state of that address on every known slave.
+"""
+import time
+
+# A stopped motor ignores duty and freq, so all stop commands are the same state
+STOPPED = (0, 0, 0)
+
+
+def motor_state(duty, freq, mode):
+    return (duty, freq, 1) if mode else STOPPED
+
+
+class MotorStateMirror:
+    def __init__(self, resend_after=1.0, broadcast_id=255):
+        self.resend_after = resend_after
+        self.broadcast_id = broadcast_id
+        # slave_id -> {device addr: (duty, freq, mode)} as last accepted by the gateway
+        self.states = {}
+        # slave_id -> {device addr: time.monotonic() of the last send}
+        self.last_sent = {}
+
+        self.forwarded = 0
+        self.suppressed = 0
+
+    def filter(self, slave_id, commands):
+        """
+        Returns the (addr, duty, freq, mode) commands for one slave that would
+        change the motor state (or refresh a stale one).
+        """
+        if slave_id == self.broadcast_id:
+            # Slaves the mirror does not know yet may be in any state
+            self.forwarded += len(commands)
+            return list(commands)
+        states = self.states.get(slave_id, {})
+        last_sent = self.last_sent.get(slave_id, {})
+        oldest_fresh = time.monotonic() - self.resend_after
+
+        changed = []
+        for command in commands:
+            addr, duty, freq, mode = command
+            if states.get(addr) == motor_state(duty, freq, mode) and last_sent.get(addr, 0) > oldest_fresh:
+                continue
+            changed.append(command)
+
+        self.forwarded += len(changed)
+        self.suppressed += len(commands) - len(changed)
+        return changed
+
+    def acknowledge(self, slave_id, commands):
+        """Records commands the gateway accepted as the current motor states."""
+        if slave_id == self.broadcast_id:
+            for known_slave in list(self.states):
+                self.acknowledge(known_slave, commands)
+            return
+        states = self.states.setdefault(slave_id, {})
+        last_sent = self.last_sent.setdefault(slave_id, {})
+        now = time.monotonic()
+        for addr, duty, freq, mode in commands:
+            states[addr] = motor_state(duty, freq, mode)
+            last_sent[addr] = now
+
+    def resync_all(self):
+        """
+        Returns {slave_id: [(addr, duty, freq, mode), ...]} re-stating every
+        known motor, e.g. after a slave rebooted.
+        """
+        return {
+            slave_id: [(addr, duty, freq, mode) for addr, (duty, freq, mode) in sorted(states.items())]
+            for slave_id, states in self.states.items() if states
+        }
+
+    def stats(self):
+        return {
+            'forwarded': self.forwarded,
+            'suppressed': self.suppressed,
+            'tracked_motors': sum(len(states) for states in self.states.values()),
+        }
@@ -1,34 +1,186 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+import numpy as np
 import serial
 import serial.tools.list_ports
-import time
+
+class SerialWriter(threading.Thread):
+    """
+    Dedicated I/O thread owning all writes to the serial connection.
+
+    Packets are handed over through a bounded queue; submit() returns a
+    concurrent.futures.Future that resolves to True/False once the packet has
+    been written (or failed). When the queue is full submit() raises
+    queue.Full, so callers see backpressure instead of blocking on the UART.
+    """
+    def __init__(self, serial_connection, max_queue=64):
+        super().__init__(name='SerialWriter', daemon=True)
+        self.serial_connection = serial_connection
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.verbose = True # print the description of every written packet
+
+        self.max_queue_depth = 0
+        self.packets_written = 0
+        self.bytes_written = 0
+        self.rejected = 0
+        self.errors = 0
+        self.last_write_duration = 0.0
+
+    def submit(self, packet, description='') -> Future:
+        future = Future()
+        try:
+            self.queue.put_nowait((packet, description, future))
+        except queue.Full:
+            self.rejected += 1
+            raise
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return future
+
+    def flush(self, timeout=None) -> bool:
+        """Waits until the packets queued so far are written. False on timeout."""
+        future = Future()
+        try:
+            self.queue.put((None, '', future), timeout=timeout)
+            return future.result(timeout)
+        except (queue.Full, TimeoutError):
+            return False
+
+    def stop(self, timeout=2):
+        """Lets the queued packets drain, then ends the thread."""
+        self.queue.put(None)
+        self.join(timeout)
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            packet, description, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            if packet is None:
+                # flush() marker: everything queued before it is written
+                future.set_result(True)
+                continue
+            start = time.perf_counter()
+            try:
+                self.serial_connection.write(packet)
+                self.packets_written += 1
+                self.bytes_written += len(packet)
+                if description and self.verbose: print(description)
+                future.set_result(True)
+            except Exception as e:
+                self.errors += 1
+                print(f'Failed to write to serial. Error: {e}')
+                future.set_result(False)
+            self.last_write_duration = time.perf_counter() - start
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'max_queue_depth': self.max_queue_depth,
+            'packets_written': self.packets_written,
+            'bytes_written': self.bytes_written,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'last_write_ms': round(self.last_write_duration * 1000, 3),
+        }
+
+# Gateway framing (see ESP_Setup/master.ino): 1-byte slave id + 60-byte payload
+COMMANDS_PER_PACKET = 20
+PAYLOAD_SIZE = 3 * COMMANDS_PER_PACKET
+PACKET_SIZE = 1 + PAYLOAD_SIZE
+PADDING = bytes([0xFF, 0xFF, 0xFF])
+
+# Gateway handshake (see ESP_Setup/master.ino): it prints READY_LINE when it
+# has booted and again whenever it receives a packet for PROBE_ID.
+PROBE_ID = 254
+READY_LINE = b'GATEWAY_READY'
+PROBE_PACKET = bytes([PROBE_ID]) + PADDING * COMMANDS_PER_PACKET
+
+# USB VID/PID of the USB-serial chips found on ESP32 gateway boards
+GATEWAY_USB_IDS = {
+    (0x303A, 0x1001): 'Espressif USB JTAG/serial',
+    (0x10C4, 0xEA60): 'Silicon Labs CP210x',
+    (0x1A86, 0x7523): 'WCH CH340',
+    (0x1A86, 0x55D4): 'WCH CH9102',
+    (0x0403, 0x6001): 'FTDI FT232',
+}
+
+def encode_command(addr, duty, freq, start_or_stop):
+    serial_group = addr // 8
+    serial_addr = addr % 8
+    byte1 = (serial_group << 2) | (start_or_stop & 0x01)
+    byte2 = 0x40 | (serial_addr & 0x3F)
+    byte3 = 0x80 | ((duty & 0x0F) << 3) | (freq & 0x07)
+    return bytes([byte1, byte2, byte3])
+
+def command_index(addr, duty, freq, start_or_stop):
+    """Index of a valid command in COMMAND_CODES / COMMAND_TABLE."""
+    return (addr << 8) | (duty << 4) | (freq << 1) | start_or_stop
+
+# The whole command space (128 addr x 16 duty x 8 freq x 2 modes) is only
+# 32768 commands, so every encoding is computed once at import.
+COMMAND_CODES = tuple(
+    encode_command(addr, duty, freq, start_or_stop)
+    for addr in range(128) for duty in range(16) for freq in range(8) for start_or_stop in range(2)
+)
+COMMAND_TABLE = np.frombuffer(b''.join(COMMAND_CODES), dtype=np.uint8).reshape(-1, 3)
+
+def encode_packets(slave_id, addrs, duties, freqs, modes):
+    """
+    Vectorized encoder: turns arrays of addr/duty/freq/start_or_stop into the
+    framed packet buffer for one slave (same bytes as SERIAL_API.build_packet),
+    in one pass. Returns None if any command is out of range.
+    """
+    addrs = np.asarray(addrs, dtype=np.int64)
+    duties = np.asarray(duties, dtype=np.int64)
+    freqs = np.asarray(freqs, dtype=np.int64)
+    modes = np.asarray(modes, dtype=np.int64)
+    if ((addrs < 0) | (addrs > 127) | (duties < 0) | (duties > 15) |
+            (freqs < 0) | (freqs > 7) | (modes < 0) | (modes > 1)).any():
+        return None
+
+    count = len(addrs)
+    packet_count = max(1, -(-count // COMMANDS_PER_PACKET))
+    payload = np.full((packet_count * COMMANDS_PER_PACKET, 3), 0xFF, dtype=np.uint8)
+    payload[:count] = COMMAND_TABLE[(addrs << 8) | (duties << 4) | (freqs << 1) | modes]
+
+    packets = np.empty((packet_count, PACKET_SIZE), dtype=np.uint8)
+    packets[:, 0] = slave_id
+    packets[:, 1:] = payload.reshape(packet_count, PAYLOAD_SIZE)
+    return packets.tobytes()
 
 class SERIAL_API:
     def __init__(self):
         self.serial_connection = None
         self.connected = False
         self.BROADCAST_ID = 255 # Use this ID to send to all slaves
+        self.writer = None # SerialWriter, see start_writer()
 
     def create_command(self, addr, duty, freq, start_or_stop):
-        serial_group = addr // 8
-        serial_addr = addr % 8
-        byte1 = (serial_group << 2) | (start_or_stop & 0x01)
-        byte2 = 0x40 | (serial_addr & 0x3F)
-        byte3 = 0x80 | ((duty & 0x0F) << 3) | (freq & 0x07)
-        return bytearray([byte1, byte2, byte3])
+        return bytearray(encode_command(addr, duty, freq, start_or_stop))
 
     def send_command(self, slave_id, addr, duty, freq, start_or_stop) -> bool:
         if not self.connected: return False
         if not (0 <= addr <= 127 and 0 <= duty <= 15 and 0 <= freq <= 7 and start_or_stop in [0, 1]): return False
         
-        payload = self.create_command(int(addr), int(duty), int(freq), int(start_or_stop))
-        payload += bytearray([0xFF, 0xFF, 0xFF]) * 19 # Padding
+        payload = COMMAND_CODES[command_index(int(addr), int(duty), int(freq), int(start_or_stop))]
+        payload += PADDING * (COMMANDS_PER_PACKET - 1) # Padding
         
         # Prepend the slave ID (or broadcast ID) to the packet
         full_packet = bytearray([slave_id]) + payload
-        
+        target = f"Slave #{slave_id}" if slave_id != self.BROADCAST_ID else "ALL Slaves (Broadcast)"
+
+        if self.writer is not None:
+            return self.writer.submit(full_packet, f'Sent command to {target} (motor #{addr})').result()
+
         try:
             self.serial_connection.write(full_packet)
-            target = f"Slave #{slave_id}" if slave_id != self.BROADCAST_ID else "ALL Slaves (Broadcast)"
             print(f'Sent command to {target} (motor #{addr})')
             return True
         except Exception as e:
@@ -37,40 +189,205 @@ class SERIAL_API:
 
     def send_command_list(self, slave_id, commands) -> bool:
         if not self.connected: return False
-        
-        payload = bytearray()
-        for c in commands:
-            addr = c.get('addr', -1)
-            duty = c.get('duty', -1)
-            freq = c.get('freq', -1)
-            start_or_stop = c.get('start_or_stop', -1)
-            if not (0 <= addr <= 127 and 0 <= duty <= 15 and 0 <= freq <= 7 and start_or_stop in [0, 1]): return False
-            payload += self.create_command(int(addr), int(duty), int(freq), int(start_or_stop))
-        
-        padding_needed = 20 - len(commands)
-        if padding_needed > 0: payload += bytearray([0xFF, 0xFF, 0xFF]) * padding_needed
+        return self.send_commands(slave_id, [
+            (c.get('addr', -1), c.get('duty', -1), c.get('freq', -1), c.get('start_or_stop', -1))
+            for c in commands
+        ])
 
-        # Prepend the slave ID (or broadcast ID)
-        full_packet = bytearray([slave_id]) + payload
+    def send_commands(self, slave_id, commands) -> bool:
+        """
+        Same as send_command_list, but takes (addr, duty, freq, start_or_stop)
+        tuples so callers holding parsed records skip building dicts.
+        """
+        if not self.connected: return False
+
+        full_packet = self.build_packet(slave_id, commands)
+        if full_packet is None: return False
+        target = f"Slave #{slave_id}" if slave_id != self.BROADCAST_ID else "ALL Slaves (Broadcast)"
+
+        if self.writer is not None:
+            # Keep a single writer of the port: go through the queue and wait.
+            return self.writer.submit(full_packet, f'Sent command list to {target}').result()
 
         try:
             self.serial_connection.write(full_packet)
-            target = f"Slave #{slave_id}" if slave_id != self.BROADCAST_ID else "ALL Slaves (Broadcast)"
             print(f'Sent command list to {target}')
             return True
         except Exception as e:
             print(f'Failed to send command list. Error: {e}')
             return False
 
+    def send_commands_async(self, slave_id, commands):
+        """
+        Non-blocking variant of send_commands for asyncio code. Returns an
+        awaitable resolving to True/False once the writer thread wrote the
+        packet. Raises queue.Full when the writer queue is full.
+        Requires start_writer().
+        """
+        loop = asyncio.get_running_loop()
+        if not self.connected or self.writer is None:
+            return self._done(loop, False)
+
+        full_packet = self.build_packet(slave_id, commands)
+        if full_packet is None:
+            return self._done(loop, False)
+        return asyncio.wrap_future(self.writer.submit(full_packet), loop=loop)
+
+    @staticmethod
+    def _done(loop, result):
+        future = loop.create_future()
+        future.set_result(result)
+        return future
+
+    def build_packet_arrays(self, slave_id, addrs, duties, freqs, modes):
+        """NumPy variant of build_packet for large batches, see encode_packets()."""
+        return encode_packets(slave_id, addrs, duties, freqs, modes)
+
+    def build_packet(self, slave_id, commands):
+        """
+        Returns the framed packet(s) for the commands, or None if one is invalid.
+        Lists longer than COMMANDS_PER_PACKET are split into several 61-byte
+        packets for the same slave, concatenated so they go out in one write.
+        """
+        codes = []
+        for addr, duty, freq, start_or_stop in commands:
+            if not (0 <= addr <= 127 and 0 <= duty <= 15 and 0 <= freq <= 7 and start_or_stop in [0, 1]): return None
+            # command_index(), inlined
+            codes.append(COMMAND_CODES[(int(addr) << 8) | (int(duty) << 4) | (int(freq) << 1) | int(start_or_stop)])
+        payload = b''.join(codes)
+
+        # Pad the last packet to a full payload (an empty list still sends one packet)
+        padding_needed = -len(commands) % COMMANDS_PER_PACKET
+        if not commands: padding_needed = COMMANDS_PER_PACKET
+        payload += PADDING * padding_needed
+
+        # Prepend the slave ID (or broadcast ID) to every 60-byte payload
+        slave_byte = bytes([slave_id])
+        return b''.join(slave_byte + payload[i:i + PAYLOAD_SIZE] for i in range(0, len(payload), PAYLOAD_SIZE))
+
+    def start_writer(self, max_queue=64):
+        """Moves all serial writes to a background thread fed by a bounded queue."""
+        if self.writer is None and self.connected:
+            self.writer = SerialWriter(self.serial_connection, max_queue)
+            self.writer.start()
+        return self.writer
+
+    def stop_writer(self):
+        if self.writer is not None:
+            self.writer.stop()
+            self.writer = None
+
     def get_serial_devices(self):
         ports = serial.tools.list_ports.comports()
         return [f"{port.device} - {port.description}" for port in ports]
 
-    def connect_serial_device(self, port_info) -> bool:
+    def get_gateway_candidates(self):
+        """
+        Serial devices that may be the gateway, as two lists: those whose USB
+        VID/PID is a known ESP32 USB-serial chip, and the others.
+        """
+        ports = serial.tools.list_ports.comports()
+        known = [port for port in ports if (port.vid, port.pid) in GATEWAY_USB_IDS]
+        others = [port for port in ports if port not in known]
+        return ([f"{port.device} - {port.description}" for port in known],
+                [f"{port.device} - {port.description}" for port in others])
+
+    @staticmethod
+    def wait_until_ready(serial_connection, timeout=2.0, first_probe=0.25, probe_interval=0.1, cancelled=None):
+        """
+        Returns as soon as the gateway answers with READY_LINE, or False after
+        `timeout` seconds. A gateway reset by opening the port prints it when
+        it has booted; one that was already running answers the probe packets
+        sent after `first_probe` seconds without a banner.
+        """
+        deadline = time.monotonic() + timeout
+        next_probe = time.monotonic() + first_probe
+        received = b''
+        previous_timeout = serial_connection.timeout
+        serial_connection.timeout = 0.02
+        try:
+            while time.monotonic() < deadline:
+                if cancelled is not None and cancelled.is_set():
+                    return False
+                if time.monotonic() >= next_probe:
+                    serial_connection.write(PROBE_PACKET)
+                    next_probe = time.monotonic() + probe_interval
+                received += serial_connection.read(serial_connection.in_waiting or 1)
+                if READY_LINE in received:
+                    serial_connection.reset_input_buffer()
+                    return True
+                received = received[-len(READY_LINE):]
+            return False
+        finally:
+            serial_connection.timeout = previous_timeout
+
+    def discover_gateway(self, baudrate=115200, timeout=2.0, exclude=()) -> bool:
+        """
+        Connects to the first port that answers the gateway handshake. Ports
+        with a known ESP32 USB-serial VID/PID are probed first (in parallel);
+        the other ports only if none of those answered. Ports in `exclude`
+        (e.g. gateways already connected) are skipped. Returns True when connected.
+        """
+        tiers = [[port_info for port_info in candidates if port_info.split(' - ')[0] not in exclude]
+                 for candidates in self.get_gateway_candidates()]
+        if not any(tiers):
+            print('No serial devices found.')
+            return False
+
+        start = time.monotonic()
+        for candidates in tiers:
+            port_info = self._probe_ports(candidates, baudrate, timeout) if candidates else None
+            if port_info is not None:
+                print(f'Found gateway on {port_info} in {time.monotonic() - start:.2f}s')
+                return self.connected
+
+        print(f'No gateway answered on {sum(len(candidates) for candidates in tiers)} serial devices.')
+        return False
+
+    def _probe_ports(self, candidates, baudrate, timeout):
+        """Probes the ports in parallel; keeps the first that answers and returns its port info."""
+        found = threading.Event()
+
+        def probe(port_info):
+            try:
+                connection = serial.Serial(port=port_info.split(' - ')[0], baudrate=baudrate,
+                                           timeout=1, write_timeout=1)
+            except Exception:
+                return port_info, None
+            try:
+                if self.wait_until_ready(connection, timeout, cancelled=found):
+                    return port_info, connection
+            except Exception:
+                pass
+            connection.close()
+            return port_info, None
+
+        found_port = None
+        with ThreadPoolExecutor(max_workers=len(candidates)) as pool:
+            for future in as_completed([pool.submit(probe, port_info) for port_info in candidates]):
+                port_info, connection = future.result()
+                if connection is None:
+                    continue
+                if found.is_set():
+                    connection.close()
+                    continue
+                found.set()
+                found_port = port_info
+                self.serial_connection = connection
+                self.connected = connection.is_open
+        return found_port
+
+    def connect_serial_device(self, port_info, baudrate=115200, ready_timeout=2.0) -> bool:
         try:
             port_name = port_info.split(' - ')[0]
-            self.serial_connection = serial.Serial(port=port_name, baudrate=115200, timeout=1, write_timeout=1)
-            time.sleep(2)
+            # serial_for_url also accepts pyserial URLs such as loop://
+            self.serial_connection = serial.serial_for_url(port_name, baudrate=baudrate, timeout=1, write_timeout=1)
+            start = time.monotonic()
+            if self.wait_until_ready(self.serial_connection, ready_timeout):
+                print(f'Gateway ready after {time.monotonic() - start:.2f}s')
+            else:
+                # Older gateway firmware does not answer: we waited as long as the old fixed delay
+                print(f'No ready signal from {port_name} after {ready_timeout}s, assuming it is up')
             self.connected = self.serial_connection.is_open
             if self.connected: print(f'Successfully connected to {port_name}')
             return self.connected
@@ -80,6 +397,7 @@ class SERIAL_API:
             return False
 
     def disconnect_serial_device(self) -> bool:
+        self.stop_writer()
         if self.serial_connection and self.serial_connection.is_open:
             self.serial_connection.close()
         self.connected = False
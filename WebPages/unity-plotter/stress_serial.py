@@ -0,0 +1,209 @@
+"""
+Throughput stress test of SERIAL_API, without the bridge.
+
+Sweeps all 128 addresses of N slaves with send_command_list (one sender thread
+per slave, sharing the serial writer thread) and/or broadcast packets, paced
+at a target rate, then stops every motor. Reports the achieved commands/s,
+the write latency distribution (send_command_list call to serial write done)
+and how many sends were dropped (writer queue full) or failed (write error or
+write timeout).
+
+A write completes once the packet is in the OS (or pty) buffer, which can
+hold far more than the link carries. So two rates are reported: commands
+written per second of sweep, and commands delivered per second until the
+link drained them (the emulator received every byte, or the port's output
+buffer is empty).
+
+Works against a real gateway, pyserial's loopback and the gateway emulator:
+
+    python stress_serial.py --port COM5 --slaves 2 --rate 2000
+    python stress_serial.py --port loop:// --rate 0
+    python stress_serial.py --emulate --slaves 4
+"""
+import argparse
+import json
+import queue
+import threading
+import time
+
+from serial_api_flexible import SERIAL_API, COMMANDS_PER_PACKET
+from latency_metrics import LatencyHistogram
+
+ADDRESSES = 128
+
+
+class SweepStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = LatencyHistogram()
+        self.sends = 0
+        self.commands = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def record(self, ok, commands, seconds):
+        with self.lock:
+            self.sends += 1
+            if ok:
+                self.commands += commands
+                self.latency.record(seconds)
+            else:
+                self.failed += 1
+
+    def drop(self):
+        with self.lock:
+            self.sends += 1
+            self.dropped += 1
+
+
+def sweep_commands(step, chunk):
+    """Yields lists of command dicts covering every address, duty rising with the step."""
+    duty = step % 15 + 1
+    for first in range(0, ADDRESSES, chunk):
+        yield [{'addr': addr, 'duty': duty, 'freq': 2, 'start_or_stop': 1}
+               for addr in range(first, min(first + chunk, ADDRESSES))]
+
+
+def sender(api, slave_id, rate, chunk, deadline, stats):
+    """Sweeps one slave until the deadline, pacing the sends to `rate` commands/s (0: unpaced)."""
+    next_send = time.monotonic()
+    step = 0
+    while time.monotonic() < deadline:
+        for commands in sweep_commands(step, chunk):
+            if rate > 0:
+                next_send += len(commands) / rate
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            if time.monotonic() >= deadline:
+                return
+            start = time.perf_counter()
+            try:
+                ok = api.send_command_list(slave_id, commands)
+            except queue.Full:
+                stats.drop()
+                continue
+            stats.record(ok, len(commands), time.perf_counter() - start)
+        step += 1
+
+
+def wait_delivered(api, emulator, timeout=10.0):
+    """Waits until every written byte has left the host; returns False on timeout."""
+    deadline = time.monotonic() + timeout
+    if not api.writer.flush(timeout):
+        return False
+    bytes_written = api.writer.bytes_written
+    while time.monotonic() < deadline:
+        if emulator is not None:
+            if emulator.bytes_received >= bytes_written:
+                return True
+        elif not api.serial_connection.out_waiting:
+            return True
+        time.sleep(0.005)
+    return False
+
+
+def drain_input(api, stop):
+    """Reads whatever the device sends back, so a loopback never fills up."""
+    connection = api.serial_connection
+    while not stop.is_set():
+        try:
+            connection.read(connection.in_waiting or 1)
+        except Exception:
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress test SERIAL_API throughput")
+    parser.add_argument('--port', help="Serial port or pyserial URL (e.g. COM5, /dev/ttyUSB0, loop://); "
+                                       "auto-discovery when omitted")
+    parser.add_argument('--emulate', action='store_true', help="Run against an in-process gateway emulator")
+    parser.add_argument('--baud', type=int, default=115200)
+    parser.add_argument('--slaves', type=int, default=1, help="Slaves to sweep, one sender thread each (default: %(default)s)")
+    parser.add_argument('--mode', choices=['list', 'broadcast', 'both'], default='list',
+                        help="Per-slave command lists, broadcast packets, or both (default: %(default)s)")
+    parser.add_argument('--rate', type=float, default=1000,
+                        help="Target commands/s per sender, 0 for as fast as possible (default: %(default)s)")
+    parser.add_argument('--chunk', type=int, default=COMMANDS_PER_PACKET,
+                        help="Commands per send_command_list call (default: %(default)s)")
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--queue', type=int, default=64, help="Serial writer queue size (default: %(default)s)")
+    parser.add_argument('--ready-timeout', type=float, default=2.0)
+    parser.add_argument('--output', help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    emulator = None
+    if args.emulate:
+        from gateway_emulator import GatewayEmulator
+        emulator = GatewayEmulator(args.slaves, args.baud).start()
+        args.port = emulator.port
+
+    api = SERIAL_API()
+    connected = (api.connect_serial_device(args.port, args.baud, args.ready_timeout) if args.port
+                 else api.discover_gateway(args.baud))
+    if not connected:
+        print("❌ Could not connect to the gateway.")
+        return
+    api.start_writer(args.queue)
+    stop_draining = threading.Event()
+    threading.Thread(target=drain_input, args=(api, stop_draining), daemon=True).start()
+
+    # Silence the per-packet prints of the writer thread during the sweep
+    api.writer.verbose = False
+    targets = []
+    if args.mode in ('list', 'both'):
+        targets += list(range(args.slaves))
+    if args.mode in ('broadcast', 'both'):
+        targets.append(api.BROADCAST_ID)
+
+    stats = SweepStats()
+    start = time.monotonic()
+    deadline = start + args.duration
+    threads = [threading.Thread(target=sender, args=(api, slave_id, args.rate, args.chunk, deadline, stats))
+               for slave_id in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    delivered = wait_delivered(api, emulator)
+    delivery_elapsed = time.monotonic() - start
+
+    # Stop every motor before leaving
+    api.send_command_list(api.BROADCAST_ID, [{'addr': addr, 'duty': 0, 'freq': 0, 'start_or_stop': 0}
+                                             for addr in range(ADDRESSES)])
+    writer_stats = api.writer.stats()
+    stop_draining.set()
+    api.disconnect_serial_device()
+
+    results = {
+        'port': args.port,
+        'targets': targets,
+        'target_rate_per_sender': args.rate,
+        'duration_s': round(elapsed, 3),
+        'sends': stats.sends,
+        'commands_sent': stats.commands,
+        'written_commands_per_s': round(stats.commands / elapsed, 1),
+        # None when the link did not drain within the timeout
+        'delivered_commands_per_s': round(stats.commands / delivery_elapsed, 1) if delivered else None,
+        'dropped_sends': stats.dropped,
+        'failed_sends': stats.failed,
+        'write_latency': stats.latency.summary(),
+        'serial_writer': writer_stats,
+    }
+    if emulator is not None:
+        # Writes complete once in the OS buffer: let the emulated UART catch up
+        caught_up = time.monotonic() + 10
+        while emulator.bytes_received < writer_stats['bytes_written'] and time.monotonic() < caught_up:
+            time.sleep(0.05)
+        results['gateway'] = emulator.stats()
+        emulator.stop()
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Ships the dispatched commands to the logging server (Debug/httpServer.py).
+
+One long-lived aiohttp session is reused for every request. Flushed batches
+are queued and sent together every `interval` seconds as one bulk request (a
+JSON array of batches, each with its own timestamp, see
+Debug/command_ingest.py), so the logging cost no longer grows with the flush
+rate. When the queue is full, new batches are dropped and counted. When the
+server is unreachable, the shipper backs off exponentially instead of failing
+once per flush.
+"""
+import asyncio
+import time
+
+import aiohttp
+
+
+class TelemetryShipper:
+    def __init__(self, url='http://localhost:5000/commands', interval=0.25,
+                 max_queue=1000, max_backoff=10.0, timeout=1.0):
+        self.url = url
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        # (timestamp, [(slave_id, addr, duty, freq, mode), ...]) per flushed batch
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.session = None
+        self._shipper = None
+        self._backoff = 0.0
+
+        self.shipped = 0
+        self.dropped = 0
+        self.failed = 0
+
+    async def start(self):
+        if self._shipper is None:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._shipper = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Ships what is still queued (one attempt) and closes the session."""
+        if self._shipper is not None:
+            self._shipper.cancel()
+            try:
+                await self._shipper
+            except asyncio.CancelledError:
+                pass
+            self._shipper = None
+        if not self.queue.empty() and self._backoff == 0:
+            await self._ship(self._drain())
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def submit(self, commands, timestamp=None):
+        """Queues one flushed batch; drops it if the queue is full."""
+        try:
+            self.queue.put_nowait((time.time() if timestamp is None else timestamp, commands))
+        except asyncio.QueueFull:
+            self.dropped += len(commands)
+
+    def _drain(self):
+        batches = []
+        while not self.queue.empty():
+            batches.append(self.queue.get_nowait())
+        return batches
+
+    async def _ship(self, batches):
+        commands = sum(len(batch) for _, batch in batches)
+        # Bulk body: one entry per flushed batch, commands as [addr, mode, duty, freq]
+        body = [
+            {'timestamp': timestamp, 'commands': [[addr, mode, duty, freq] for _, addr, duty, freq, mode in batch]}
+            for timestamp, batch in batches
+        ]
+        try:
+            async with self.session.post(self.url, json=body) as response:
+                response.raise_for_status()
+        except Exception as e:
+            self.failed += commands
+            if self._backoff == 0:
+                print(f"⚠️  Could not reach logging server ({e}), backing off")
+            self._backoff = min(max(self._backoff * 2, self.interval), self.max_backoff)
+            return
+        if self._backoff:
+            print("✅ Logging server reachable again")
+        self._backoff = 0.0
+        self.shipped += commands
+
+    async def _run(self):
+        while True:
+            # Sleep until there is something to ship, then let batches accumulate
+            first = await self.queue.get()
+            await asyncio.sleep(self._backoff or self.interval)
+            await self._ship([first] + self._drain())
+
+    def stats(self):
+        return {
+            'shipped': self.shipped,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'queued_batches': self.queue.qsize(),
+        }
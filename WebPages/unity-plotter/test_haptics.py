@@ -1,8 +1,10 @@
 # test_haptics.py
 
-from serial_api_espnow import SERIAL_API
+from serial_api_flexible import SERIAL_API
 import time
 
+SLAVE_ID = 0 # slave the motor is wired to (255 = all slaves)
+
 # 1. Create an instance of your API
 api = SERIAL_API()
 
@@ -12,17 +14,17 @@ if not ports:
     print("❌ No gateway found. Please check the connection.")
 else:
     print(f"✅ Found gateway: {ports[0]}")
-    if api.connect_serial_device(ports[2]):
+    if api.connect_serial_device(ports[0]):
 
         # 3. Send a test command to turn a motor ON
         print("\n--> Sending START command to motor #5...")
-        # send_command(addr, duty, freq, start_or_stop)
-        api.send_command(0, 15, 7, 1) # Start motor 5 at max power
+        # send_command(slave_id, addr, duty, freq, start_or_stop)
+        api.send_command(SLAVE_ID, 5, 15, 7, 1) # Start motor 5 at max power
         time.sleep(2) # Keep it on for 2 seconds
 
         # 4. Send a command to turn the motor OFF
         print("--> Sending STOP command to motor #5...")
-        api.send_command(0, 0, 0, 0) # Stop motor 5
+        api.send_command(SLAVE_ID, 5, 0, 0, 0) # Stop motor 5
         time.sleep(1)
 
         # 5. Disconnect cleanly
@@ -0,0 +1,151 @@
+"""
+Address -> slave routing table for the ESP-NOW haptic setup.
+
+Unity addresses actuators with one global 'addr'. The topology says which
+slave board drives each address and where it sits on that board (serial group
+and local address on the group's chain). It is loaded once at startup from a
+JSON file (see topology.example.json):
+
+    {
+      "slaves": [
+        {"slave_id": 0, "first_addr": 0,  "count": 64},
+        {"slave_id": 1, "first_addr": 64, "count": 64, "first_group": 0}
+      ],
+      "addresses": {
+        "130": {"slave_id": 1, "serial_group": 2, "local_addr": 3}
+      },
+      "gateways": [
+        {"port": "/dev/ttyUSB0", "slaves": [0, 1]},
+        {"port": "/dev/ttyUSB1", "slaves": [2, 3]}
+      ]
+    }
+
+Ranges in "slaves" fill consecutive groups of GROUP_SIZE motors; entries in
+"addresses" override single addresses. Addresses not in the table keep the
+legacy behaviour: the command's own slave_id (or 0) and the address unchanged.
+
+"gateways" shards the slaves over several gateway ESP32s, each on its own
+serial link. The n-th slave_id listed for a gateway is that gateway's ESP-NOW
+slave #n. Every gateway needs its "port" when there are several: the
+handshake does not tell gateways apart, so only a single gateway may omit it
+and be found by auto-discovery. Without "gateways" there is a single gateway
+and slave ids are used as they are.
+"""
+import json
+import os
+from collections import namedtuple
+
+# Motors per serial group, as encoded by SERIAL_API.create_command (addr // 8, addr % 8)
+GROUP_SIZE = 8
+MAX_GROUPS = 16
+
+Route = namedtuple('Route', ['slave_id', 'serial_group', 'local_addr'])
+
+
+class Topology:
+    def __init__(self, routes=None):
+        # addr -> (slave_id, device addr as understood by SERIAL_API)
+        self.routes = {}
+        for addr, route in (routes or {}).items():
+            self.add(addr, route)
+        # [{'port': str or None, 'slaves': [slave_id, ...]}]; empty means one gateway
+        self.gateways = []
+        # slave_id -> (gateway index, slave id on that gateway)
+        self.slave_gateways = {}
+
+    def add_gateway(self, port, slaves):
+        index = len(self.gateways)
+        for local_id, slave_id in enumerate(slaves):
+            if slave_id in self.slave_gateways:
+                raise ValueError(f"slave {slave_id} is assigned to more than one gateway")
+            self.slave_gateways[slave_id] = (index, local_id)
+        self.gateways.append({'port': port, 'slaves': list(slaves)})
+
+    def add(self, addr, route):
+        if not (0 <= route.serial_group < MAX_GROUPS and 0 <= route.local_addr < GROUP_SIZE):
+            raise ValueError(f"invalid route for addr {addr}: {route}")
+        self.routes[int(addr)] = (route.slave_id, route.serial_group * GROUP_SIZE + route.local_addr)
+
+    @classmethod
+    def from_dict(cls, config):
+        topology = cls()
+        for entry in config.get('slaves', []):
+            first_addr = entry['first_addr']
+            first_group = entry.get('first_group', 0)
+            for i in range(entry['count']):
+                topology.add(first_addr + i, Route(entry['slave_id'],
+                                                   first_group + i // GROUP_SIZE,
+                                                   i % GROUP_SIZE))
+        for addr, entry in config.get('addresses', {}).items():
+            topology.add(addr, Route(entry['slave_id'], entry['serial_group'], entry['local_addr']))
+        for entry in config.get('gateways', []):
+            topology.add_gateway(entry.get('port'), entry.get('slaves', []))
+        if len(topology.gateways) > 1 and not all(gateway['port'] for gateway in topology.gateways):
+            raise ValueError("every gateway needs a 'port' when there are several gateways")
+        return topology
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads the topology from a JSON file. A missing file gives an empty
+        table, i.e. the legacy single-slave behaviour.
+        """
+        if not os.path.exists(path):
+            print(f"No topology file at {path}, using legacy addressing.")
+            return cls()
+        with open(path) as f:
+            topology = cls.from_dict(json.load(f))
+        slaves = sorted({slave_id for slave_id, _ in topology.routes.values()})
+        print(f"Loaded topology: {len(topology.routes)} addresses on slaves {slaves}")
+        if topology.gateways:
+            print(f"Slaves sharded over {len(topology.gateways)} gateways: "
+                  f"{[gateway['slaves'] for gateway in topology.gateways]}")
+        return topology
+
+    def route(self, slave_id, addr):
+        """Returns (slave_id, device addr) for one command."""
+        route = self.routes.get(addr)
+        if route is not None:
+            return route
+        return (0 if slave_id is None else slave_id), addr
+
+    def routable(self, addr):
+        """False for an address without a route that is out of SERIAL_API's device range."""
+        return addr in self.routes or 0 <= addr < MAX_GROUPS * GROUP_SIZE
+
+    def split(self, commands):
+        """
+        Splits (slave_id, addr, duty, freq, mode) records into per-slave lists
+        of (device addr, duty, freq, mode) tuples, ready for SERIAL_API.
+        """
+        per_slave = {}
+        for slave_id, addr, duty, freq, mode in commands:
+            slave_id, device_addr = self.route(slave_id, addr)
+            per_slave.setdefault(slave_id, []).append((device_addr, duty, freq, mode))
+        return per_slave
+
+    def gateway_count(self):
+        return max(len(self.gateways), 1)
+
+    def gateway_of(self, slave_id):
+        """
+        Returns (gateway index, slave id on that gateway). Slaves missing from
+        the gateway table, and all slaves with a single gateway, go to gateway 0
+        unchanged.
+        """
+        return self.slave_gateways.get(slave_id, (0, slave_id))
+
+    def split_gateways(self, per_slave, broadcast_id=255):
+        """
+        Groups a {slave_id: commands} dict by gateway index. Broadcast commands
+        are sent through every gateway.
+        """
+        per_gateway = {}
+        for slave_id, commands in per_slave.items():
+            if slave_id == broadcast_id:
+                indexes = range(self.gateway_count())
+            else:
+                indexes = (self.gateway_of(slave_id)[0],)
+            for index in indexes:
+                per_gateway.setdefault(index, {})[slave_id] = commands
+        return per_gateway